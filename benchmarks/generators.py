@@ -0,0 +1,211 @@
+"""Synthetic raw data generators.
+
+This module writes deterministic .csv files shaped like the raw data of
+each dataset: the DANE exports columns and the UN Comtrade columns of
+config.Exports and config.Korea_Imports, with realistic cardinalities,
+decimal separators and about 1% duplicated rows, so the ingest and
+transform phases can be benchmarked at any size.
+
+Rows are generated and written in chunks, so memory doesn't grow with
+the file size. The same rows and seed always give the same file.
+
+Typical usage:
+    uv run ./benchmarks/generators.py exports ./data/benchmarks/ --rows 10000000
+
+Attributes:
+    SIZES: benchmark sizes by name.
+    WORKLOAD: version of the generated rows.
+    exports_chunk: generates a chunk of raw exports rows.
+    korea_imports_chunk: generates a chunk of raw korea imports rows.
+    generators: chunk generator of each dataset key.
+    write_csv: writes a synthetic raw .csv file of a dataset.
+"""
+
+import os
+import sys
+import argparse
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as csv
+
+sys.path.append("./ingest/")
+import config  # type: ignore
+
+SIZES = {"1M": 1_000_000, "10M": 10_000_000, "50M": 50_000_000}
+
+# Bumped whenever generated rows change, so raw files are generated again
+# and benchmark runs are only compared with runs of the same rows.
+WORKLOAD = 2
+
+CHUNK_ROWS = 1_000_000
+
+COUNTRIES = [
+    "USA", "KOR", "CHN", "ECU", "PER", "MEX", "BRA", "CHL", "PAN", "VEN",
+    "ESP", "DEU", "NLD", "JPN", "IND", "CAN", "GTM", "CRI", "DOM", "ARG",
+]  # fmt: skip
+
+DPTOS = [76, 5, 11, 8, 13, 25, 68, 66, 17, 54, 0]
+
+PARTNERS = [
+    "World", "China", "USA", "Colombia", "Peru", "Chile", "Mexico", "Brazil",
+    "Argentina", "Ecuador", "Spain", "Portugal", "Japan", "Viet Nam", "Germany",
+]  # fmt: skip
+
+
+def _pick(rng: np.random.Generator, values: list, rows: int) -> pa.Array:
+    """Picks values with a skewed, Zipf-like, frequency."""
+    weights = 1 / np.arange(1, len(values) + 1)
+    indices = rng.choice(len(values), rows, p=weights / weights.sum())
+    return pc.take(pa.array(values), pa.array(indices))
+
+
+def _monetary(
+    rng: np.random.Generator, rows: int, mean: float, separator: str
+) -> pa.Array:
+    """Log-normal monetary values as strings with two decimals."""
+    units = pa.array(rng.lognormal(mean, 2.0, rows).astype(np.int64))
+    cents = pc.utf8_lpad(
+        pc.cast(pa.array(rng.integers(0, 100, rows)), pa.string()), 2, "0"
+    )
+    return pc.binary_join_element_wise(pc.cast(units, pa.string()), cents, separator)
+
+
+def _duplicate(rng: np.random.Generator, table: pa.Table) -> pa.Table:
+    """Replaces about 1% of the rows of a table with copies of other rows."""
+    rows = table.num_rows
+    indices = np.arange(rows)
+    copies = rng.random(rows) < 0.01
+    indices[copies] = rng.integers(0, rows, copies.sum())
+    return table.take(pa.array(indices))
+
+
+def exports_chunk(rng: np.random.Generator, rows: int) -> pa.Table:
+    """Generates a chunk of raw exports rows.
+
+    Columns are config.Exports.Columns_To_Drop followed by the kept
+    columns. HS codes lose their leading zeros, as in the raw files,
+    and monetary values use a decimal comma.
+
+    Args:
+        rng (np.random.Generator): random generator.
+        rows (int): number of rows.
+    """
+    # HS codes of 9 or 10 digits, the 9 digits ones lost a leading zero.
+    hs_codes = rng.integers(101_000_000, 9_999_999_999, 5_000).tolist()
+    columns = {
+        column: pa.array(rng.integers(0, 1_000, rows))
+        for column in config.Exports.Columns_To_Drop
+    }
+    columns["FECH"] = pa.array(rng.integers(2301, 2313, rows))
+    columns.update(
+        {
+            "MODAD": _pick(rng, [198, 100, 200, 300], rows),
+            "POSAR": _pick(rng, hs_codes, rows),
+            "DPTO1": _pick(rng, DPTOS, rows),
+            "FOBPES": _monetary(rng, rows, 16.0, ","),
+            "AGRENA": _monetary(rng, rows, 9.0, ","),
+            "COD_PAI4": _pick(rng, COUNTRIES, rows),
+        }
+    )
+    return _duplicate(rng, pa.table(columns))
+
+
+def korea_imports_chunk(rng: np.random.Generator, rows: int) -> pa.Table:
+    """Generates a chunk of raw korea imports rows.
+
+    Columns are config.Korea_Imports.Columns_To_Drop followed by the
+    kept columns, as the UN Comtrade API exports them. Commodity codes
+    are HS headings of 4 digits that lose their leading zero, as the raw
+    files do, so they span all chapters once formatted.
+
+    Args:
+        rng (np.random.Generator): random generator.
+        rows (int): number of rows.
+    """
+    columns = {
+        column: pa.array(rng.integers(0, 1_000, rows))
+        for column in config.Korea_Imports.Columns_To_Drop
+    }
+    constants = {
+        "typeCode": "C",
+        "freqCode": "A",
+        "reporterISO": "KOR",
+        "reporterDesc": "Rep. of Korea",
+        "flowCode": "M",
+        "flowDesc": "Import",
+        "classificationCode": "H6",
+        "isReported": "true",
+        "isAggregate": "true",
+    }
+    for column, value in constants.items():
+        columns[column] = pa.array([value] * rows)
+    columns["refYear"] = pa.array(rng.integers(2015, 2025, rows))
+    # HS headings 0101 to 9799, the ones of chapters 01 to 09 lost a zero.
+    headings = pc.cast(
+        _pick(rng, rng.integers(101, 9_800, 1_200).tolist(), rows), pa.string()
+    )
+    columns["cmdDesc"] = pc.binary_join_element_wise("Heading ", headings, "")
+    columns.update(
+        {
+            "partnerDesc": _pick(rng, PARTNERS, rows),
+            "cmdCode": headings,
+            "primaryValue": _monetary(rng, rows, 12.0, "."),
+        }
+    )
+    return _duplicate(rng, pa.table(columns))
+
+
+generators = {
+    "exports": exports_chunk,
+    "korea-imports": korea_imports_chunk,
+}
+
+
+def write_csv(key: str, path: str, rows: int, seed: int = 0) -> str:
+    """Writes a synthetic raw .csv file of a dataset.
+
+    The file is only written if it doesn't exist yet.
+
+    Args:
+        key (str): dataset key in generators.
+        path (str): .csv file path.
+        rows (int): number of rows.
+        seed (int): random seed.
+
+    Returns:
+        The .csv file path.
+    """
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    print(f"Generating {rows:,} synthetic {key} rows...\n")
+
+    writer = None
+    for chunk, start in enumerate(range(0, rows, CHUNK_ROWS)):
+        rng = np.random.default_rng([seed, chunk])
+        table = generators[key](rng, min(CHUNK_ROWS, rows - start))
+        if writer is None:
+            writer = csv.CSVWriter(path + ".tmp", table.schema)
+        writer.write_table(table)
+    if writer is not None:
+        writer.close()
+    os.replace(path + ".tmp", path)
+
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates synthetic raw data.")
+    parser.add_argument("key", choices=list(generators))
+    parser.add_argument("dir")
+    parser.add_argument("--rows", type=int, default=SIZES["1M"])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_csv(
+        args.key,
+        os.path.join(args.dir, f"{args.key}-{args.rows}-{args.seed}-w{WORKLOAD}.csv"),
+        args.rows,
+        args.seed,
+    )
@@ -0,0 +1,160 @@
+"""Benchmark of the entry points import time.
+
+This module imports each entry point in a fresh interpreter with
+python -X importtime, and reports its import time and the packages
+taking most of it, best of several runs.
+
+Heavy packages are imported by the code using them, so each entry point
+fails the benchmark if it imports one of its deferred packages, or if
+it takes longer than a given budget.
+
+Typical usage:
+    uv run ./benchmarks/imports.py --budget-ms 1500
+"""
+
+import re
+import sys
+import json
+import argparse
+import subprocess
+from collections import defaultdict
+
+# Entry point directory and module, and the packages it must not import.
+ENTRY_POINTS = {
+    "ingest": {
+        "dir": "./ingest/",
+        "module": "pipeline",
+        "deferred": ["pandas", "pyarrow.dataset", "pyarrow.compute", "boto3"],
+    },
+    "transform": {
+        "dir": "./transform/",
+        "module": "pipeline",
+        "deferred": [
+            "pandas",
+            "pyarrow.dataset",
+            "pyarrow.compute",
+            "boto3",
+            "sklearn",
+        ],
+    },
+    "visualize": {
+        "dir": "./visualize/",
+        "module": "main",
+        "deferred": ["duckdb", "boto3"],
+    },
+}
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def import_time(dir: str, module: str) -> list[tuple[str, int, int]]:
+    """Imports a module in a fresh interpreter and parses its import times.
+
+    Args:
+        dir (str): directory prepended to sys.path, as when run as a script.
+        module (str): module to import.
+
+    Returns:
+        The imported modules, in import order, with their self and
+        cumulative import time in microseconds.
+
+    Raises:
+        RuntimeError: if the module can't be imported.
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"import sys; sys.path.insert(0, {dir!r}); import {module}",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{module} can't be imported:\n{result.stderr}")
+
+    modules = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            modules.append((match[4], int(match[1]), int(match[2])))
+    return modules
+
+
+def report(entry: dict, repeat: int, top: int) -> dict:
+    """Import time report of an entry point, best of repeat runs.
+
+    Args:
+        entry (dict): entry point declaration, from ENTRY_POINTS.
+        repeat (int): number of runs.
+        top (int): number of packages listed.
+
+    Returns:
+        The entry point "total-ms", its "packages" self import time in ms,
+        summed by top-level package, and the "deferred" packages it imported.
+    """
+    runs = [import_time(entry["dir"], entry["module"]) for _ in range(repeat)]
+    # The entry point module is the last one to finish importing.
+    best = min(runs, key=lambda modules: modules[-1][2])
+
+    packages: dict[str, int] = defaultdict(int)
+    for module, self_us, _ in best:
+        packages[module.split(".")[0]] += self_us
+    imported = {module for module, _, _ in best}
+
+    return {
+        "total-ms": best[-1][2] / 1000,
+        "packages": {
+            package: self_us / 1000
+            for package, self_us in sorted(
+                packages.items(), key=lambda item: item[1], reverse=True
+            )[:top]
+        },
+        "deferred": [module for module in entry["deferred"] if module in imported],
+    }
+
+
+def main(repeat: int, top: int, budget_ms: float | None, output: str | None):
+    reports = {}
+    failed = False
+
+    for name, entry in ENTRY_POINTS.items():
+        reports[name] = report(entry, repeat, top)
+        total = reports[name]["total-ms"]
+        print(f"{name}: {total:.0f} ms (best of {repeat})")
+        for package, ms in reports[name]["packages"].items():
+            print(f"  {package}: {ms:.0f} ms")
+
+        if reports[name]["deferred"]:
+            failed = True
+            print(
+                f"  imports deferred packages: {', '.join(reports[name]['deferred'])}"
+            )
+        if budget_ms is not None and total > budget_ms:
+            failed = True
+            print(f"  exceeds the {budget_ms:.0f} ms budget")
+        print()
+
+    if output:
+        with open(output, "w") as file:
+            json.dump(reports, file, indent=2)
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the import time.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=None,
+        help="maximum import time of each entry point.",
+    )
+    parser.add_argument("--output", default=None, help="json report file path.")
+    args = parser.parse_args()
+    main(repeat=args.repeat, top=args.top, budget_ms=args.budget_ms, output=args.output)
@@ -0,0 +1,365 @@
+"""Benchmark suite of the ingest and transform phases.
+
+This module generates synthetic raw data for each dataset (see
+generators.py), and times each stage of its way to the database:
+
+    unify_csv: scanning the raw .csv file into a pyarrow table.
+    Load.<step>: each cleaning step, run on pyarrow tables.
+    Load.save_to_parquet: writing the clean table.
+    clean (<mode>): the whole cleaning chain, as the ingest phase runs it
+      in each config.Execution.Mode, into a staged dataset.
+    dedup_partitions: deduplicating the staged dataset.
+    transform.<table>: building each table of the transform phase that
+      reads the dataset.
+
+Each stage is timed best of several runs, with its CPU time, peak
+resident memory and throughput. Results are appended to a history
+file, and compared with the last run of the same stage and size, so
+regressions show up over time.
+
+Typical usage:
+    uv run ./benchmarks/suite.py --sizes 1M 10M --modes sql arrow
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import graphlib
+import tempfile
+import resource
+import subprocess
+import contextlib
+import duckdb
+
+sys.path.append("./ingest/")
+sys.path.append("./transform/")
+import config  # type: ignore
+from load import Load, unify_csv, create_table, dedup_partitions  # type: ignore
+from pipeline import clean  # type: ignore
+from tables import tables  # type: ignore
+from cluster import cluster_table, model_pool  # type: ignore
+from generators import SIZES, WORKLOAD, write_csv
+
+DIR = config.Local_Dir.Data + "benchmarks/"
+HISTORY = DIR + "history.jsonl"
+
+# Table of the transform phase reading each dataset.
+SOURCES = {"exports": "valle_exports", "korea-imports": "korea_imports"}
+
+
+def reset_peak_rss():
+    """Resets the peak resident memory of the process, where it's possible.
+
+    Only Linux allows it. Elsewhere, the peak is the process peak so far.
+    """
+    with contextlib.suppress(OSError):
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+
+
+def peak_rss() -> int:
+    """Peak resident memory of the process since the last reset, in bytes."""
+    with contextlib.suppress(OSError):
+        with open("/proc/self/status") as file:
+            return int(re.search(r"VmHWM:\s+(\d+)", file.read())[1]) * 1024  # type: ignore
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure(function, repeat: int):
+    """Runs a function repeat times, timing it.
+
+    Args:
+        function: function without arguments to run.
+        repeat (int): number of runs.
+
+    Returns:
+        The result of the last run, and the wall time, CPU time and peak
+        resident memory of the fastest run.
+    """
+    best = None
+    for _ in range(repeat):
+        reset_peak_rss()
+        wall, cpu = time.perf_counter(), time.process_time()
+        # The pipeline progress messages would bury the results.
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function()
+        run = {
+            "wall": time.perf_counter() - wall,
+            "cpu": time.process_time() - cpu,
+            "peak-rss": peak_rss(),
+        }
+        if best is None or run["wall"] < best["wall"]:
+            best = run
+    return result, best
+
+
+def commoditie_format(dataset: dict) -> dict:
+    """format_commoditie_code arguments from a dataset configuration."""
+    commoditie_format = dataset["commoditie-col-format"]
+    return {
+        "commoditie_col": commoditie_format["commoditie-col"],
+        "pad_": commoditie_format["pad"],
+        "slice_": commoditie_format["slice"],
+        "width": commoditie_format["width"],
+        "side": commoditie_format["side"],
+        "fillchar": commoditie_format["fillchar"],
+        "stop": commoditie_format["stop"],
+    }
+
+
+def bench_dataset(
+    key: str, rows: int, modes: list[str], repeat: int, seed: int
+) -> list[dict]:
+    """Benchmarks the stages of a dataset at a size.
+
+    Args:
+        key (str): dataset key in config.datasets.
+        rows (int): number of raw rows.
+        modes (list[str]): config.Execution.Mode values to run the whole
+          cleaning chain in.
+        repeat (int): number of runs of each stage.
+        seed (int): random seed of the raw data.
+
+    Returns:
+        The results of each stage.
+    """
+    dataset = config.datasets[key]
+    raw = write_csv(
+        key, os.path.join(DIR, f"{key}-{rows}-{seed}-w{WORKLOAD}.csv"), rows, seed
+    )
+    size = os.path.getsize(raw)
+    results = []
+
+    def stage(name: str, function):
+        result, run = measure(function, repeat)
+        run.update(
+            {
+                "dataset": key,
+                "rows": rows,
+                "workload": WORKLOAD,
+                "stage": name,
+                "rows-per-s": rows / run["wall"],
+                "mb-per-s": size / 1024**2 / run["wall"],
+            }
+        )
+        results.append(run)
+        print(
+            f"  {name:<48} {run['wall']:8.3f}s {run['cpu']:8.3f}s cpu "
+            f"{run['rows-per-s'] / 1e6:7.2f}M rows/s "
+            f"{run['peak-rss'] / 1024**2:7.0f} MB peak"
+        )
+        return result
+
+    print(f"{key}, {rows:,} rows ({size / 1024**2:.0f} MB):")
+    # As in clean, monetary columns typed by the csv schema are already numbers.
+    monetary_cols = [
+        column
+        for column in dataset["monetary-cols"]
+        if column not in dataset["csv-schema"]["types"]
+    ]
+
+    table = stage(
+        "unify_csv",
+        lambda: Load(unify_csv([raw], schema=dataset["csv-schema"]))
+        .purge_columns(dataset["drop-cols"])
+        .get_pyarrow_table()
+        .data,
+    )
+    steps = [
+        (
+            "Load.fix_monetary_punctuation",
+            lambda table: Load(table).fix_monetary_punctuation(monetary_cols),
+        ),
+        (
+            "Load.format_commoditie_code",
+            lambda table: Load(table).format_commoditie_code(
+                **commoditie_format(dataset)
+            ),
+        ),
+        (
+            "Load.cast_dtypes",
+            lambda table: Load(table).cast_dtypes(dataset["dtypes"]),
+        ),
+        (
+            "Load.purge_duplicates",
+            lambda table: Load(table).purge_duplicates(
+                dataset["dedup-keys"], config.Dedup.Fingerprint_Bits
+            ),
+        ),
+    ]
+    for name, step in steps:
+        if name == "Load.fix_monetary_punctuation" and not monetary_cols:
+            continue
+        table = stage(name, lambda step=step, table=table: step(table).data)
+
+    with tempfile.TemporaryDirectory(dir=DIR) as tmp:
+        stage(
+            "Load.save_to_parquet",
+            lambda: Load(table).save_to_parquet(
+                tmp + "/parquet/",
+                "data.parquet",
+                dictionary_cols=dataset["dictionary-cols"],
+                overwrite=True,
+            ),
+        )
+        # Released, so it doesn't add to the peak memory of the next stages.
+        table = None
+
+        stage_dir, clean_dir = tmp + "/stage/", tmp + "/clean/"
+        default_mode = config.Execution.Mode
+        for mode in modes:
+            config.Execution.Mode = mode
+            stage(
+                f"clean ({mode})",
+                lambda: clean(
+                    Load(unify_csv([raw], schema=dataset["csv-schema"])), dataset
+                ).save_to_dataset(
+                    dir=stage_dir,
+                    basename="raw",
+                    partition_cols=dataset["partition-cols"],
+                    dictionary_cols=dataset["dictionary-cols"],
+                ),
+            )
+        config.Execution.Mode = default_mode
+
+        def dedup():
+            # Partitions are only deduplicated if their clean file is stale.
+            for path, _, files in os.walk(clean_dir):
+                for file in files:
+                    os.remove(os.path.join(path, file))
+            return dedup_partitions(
+                stage_dir,
+                clean_dir,
+                keys=dataset["dedup-keys"],
+                dtypes=dataset["dtypes"],
+                dictionary_cols=dataset["dictionary-cols"],
+            )
+
+        stage("dedup_partitions", dedup)
+
+        source = SOURCES[key]
+        built = {source}
+        sorter = graphlib.TopologicalSorter(
+            {name: table["depends-on"] for name, table in tables.items()}
+        )
+        with (
+            duckdb.connect(os.path.join(tmp, "db.duckdb")) as connection,
+            model_pool() as models,
+        ):
+            for name in sorter.static_order():
+                if name != source and not built & set(tables[name]["depends-on"]):
+                    continue
+                built.add(name)
+                query = tables[name]["query"]
+                for pattern in tables[name]["sources"]:
+                    query = query.replace(pattern, clean_dir + "*/*.parquet")
+                stage(
+                    f"transform.{name}",
+                    lambda name=name, query=query: cluster_table(
+                        connection, name, query, tables[name]["model"], models
+                    )
+                    if "model" in tables[name]
+                    else create_table(
+                        connection,
+                        name,
+                        query,
+                        tables[name]["dtypes"],
+                        view=tables[name]["view"],
+                    ),
+                )
+
+    print()
+    return results
+
+
+def compare(results: list[dict], history: list[dict]):
+    """Prints the change of each stage since its last run at the same size.
+
+    Runs of other workloads (see generators.WORKLOAD) aren't compared.
+
+    Args:
+        results (list[dict]): results of this run.
+        history (list[dict]): results of previous runs, oldest first.
+    """
+
+    def stage(run: dict) -> tuple:
+        return run["dataset"], run["rows"], run.get("workload", 1), run["stage"]
+
+    last = {stage(run): run for run in history}
+    changes = []
+    for run in results:
+        previous = last.get(stage(run))
+        if previous:
+            changes.append(
+                (run["wall"] / previous["wall"] - 1, run, previous["created-at"])
+            )
+    if not changes:
+        return
+
+    print("Change since the last run:")
+    for change, run, created_at in sorted(changes, key=lambda item: -item[0]):
+        print(
+            f"  {run['dataset']}, {run['rows']:,} rows, {run['stage']}: "
+            f"{change:+.0%} ({created_at})"
+        )
+    print()
+
+
+def main(sizes: list[int], keys: list[str], modes: list[str], repeat: int, seed: int):
+    os.makedirs(DIR, exist_ok=True)
+    # Benchmarks time the stages themselves, without the run reports.
+    config.Metrics.Enabled = False
+
+    results = []
+    for rows in sizes:
+        for key in keys:
+            results += bench_dataset(key, rows, modes, repeat, seed)
+
+    history = []
+    if os.path.exists(HISTORY):
+        with open(HISTORY) as file:
+            history = [json.loads(line) for line in file if line.strip()]
+    compare(results, history)
+
+    commit = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+    ).stdout.strip()
+    created_at = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    with open(HISTORY, "a") as file:
+        for run in results:
+            file.write(
+                json.dumps({"created-at": created_at, "commit": commit, **run}) + "\n"
+            )
+    print(f"Results appended to {HISTORY}.\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the pipeline stages.")
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=lambda size: SIZES[size] if size in SIZES else int(size),
+        default=[SIZES["1M"]],
+        help=f"numbers of raw rows, or {', '.join(SIZES)}.",
+    )
+    parser.add_argument(
+        "--datasets", nargs="+", choices=list(SOURCES), default=list(SOURCES)
+    )
+    parser.add_argument(
+        "--modes", nargs="+", choices=["sql", "arrow", "pandas"], default=["sql"]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(
+        sizes=args.sizes,
+        keys=args.datasets,
+        modes=args.modes,
+        repeat=args.repeat,
+        seed=args.seed,
+    )
@@ -0,0 +1,114 @@
+"""Benchmark of the Load string transforms.
+
+This module compares the pandas and the pyarrow.compute implementations
+of fix_monetary_punctuation, format_commoditie_code and cast_dtypes on a
+synthetic exports table.
+
+Typical usage:
+    uv run ./benchmarks/transforms.py --rows 10000000
+"""
+
+import sys
+import time
+import argparse
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+sys.path.append("./ingest/")
+import config  # type: ignore
+from load import Load  # type: ignore
+
+
+def synthetic_exports(rows: int, seed: int = 0) -> pa.Table:
+    """Creates a synthetic table shaped like the raw exports after purging columns.
+
+    Args:
+        rows (int): number of rows.
+        seed (int): random seed.
+
+    Returns:
+        A pyarrow table with raw-like string monetary and HS code columns.
+    """
+    rng = np.random.default_rng(seed)
+
+    def monetary(high: int) -> pa.ChunkedArray:
+        return pc.binary_join_element_wise(
+            pc.cast(pa.array(rng.integers(1, high, rows)), pa.string()),
+            pc.cast(pa.array(rng.integers(0, 100, rows)), pa.string()),
+            ",",
+        )
+
+    return pa.table(
+        {
+            "MODAD": rng.choice([100, 198], rows),
+            "POSAR": pa.array(rng.integers(101_000_000, 9_999_999_999, rows)),
+            "DPTO1": pa.array(rng.integers(0, 100, rows)),
+            "FOBPES": monetary(10**9),
+            "AGRENA": monetary(10**6),
+            "COD_PAI4": pa.array(rng.choice(["KOR", "USA", "CHN", "ECU"], rows)),
+        }
+    )
+
+
+def pandas_path(table: pa.Table) -> Load:
+    """Runs the transforms converting the table to a pandas dataframe."""
+    return (
+        Load(table)
+        .table_to_dataframe()
+        .fix_monetary_punctuation(config.Exports.Monetary_Cols)
+        .format_commoditie_code(**commoditie_format())
+        .cast_dtypes(config.Exports.Dtypes)
+    )
+
+
+def arrow_path(table: pa.Table) -> Load:
+    """Runs the transforms on the pyarrow table with pyarrow.compute."""
+    return (
+        Load(table)
+        .fix_monetary_punctuation(config.Exports.Monetary_Cols)
+        .format_commoditie_code(**commoditie_format())
+        .cast_dtypes(config.Exports.Dtypes)
+    )
+
+
+def commoditie_format() -> dict:
+    """format_commoditie_code arguments from the exports configuration."""
+    commoditie_format = config.Exports.Commoditie_Code_Format
+    return {
+        "commoditie_col": commoditie_format["commoditie-col"],
+        "pad_": commoditie_format["pad"],
+        "slice_": commoditie_format["slice"],
+        "width": commoditie_format["width"],
+        "side": commoditie_format["side"],
+        "fillchar": commoditie_format["fillchar"],
+        "stop": commoditie_format["stop"],
+    }
+
+
+def main(rows: int, repeat: int):
+    print(f"Generating {rows:,} synthetic exports rows...\n")
+    table = synthetic_exports(rows)
+
+    timings = {}
+    for name, path in [("pandas", pandas_path), ("arrow", arrow_path)]:
+        elapsed = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            path(table)
+            elapsed.append(time.perf_counter() - start)
+        timings[name] = min(elapsed)
+        print(f"{name}: {timings[name]:.2f}s (best of {repeat})")
+
+    print(
+        f"\narrow/pandas time ratio: {timings['arrow'] / timings['pandas']:.2f} "
+        f"({timings['arrow']:.2f}s / {timings['pandas']:.2f}s), below 1 when arrow is faster"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the Load transforms.")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(rows=args.rows, repeat=args.repeat)
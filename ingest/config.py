@@ -7,10 +7,17 @@ Attributes:
     check_dir_exists: checks if a given local directory exists.
     S3: configuration values for S3 API.
     Local_Dir: configuration values for project folder.
-    Filename: configuration values for created files.
     Exports: configuration values for exports data.
     Local_Commerce: configuration values for local commerce data.
     Korea_Imports: configuration values for korea imports data.
+    Execution: configuration values for the cleaning execution.
+    Parquet: configuration values for parquet writing.
+    Resources: resource budget of the ingest and transform phases.
+    Transform: configuration values for the transform execution.
+    Cluster: configuration values for the clustering of the transform phase.
+    Dashboard: configuration values for the dashboard.
+    Dedup: configuration values for deduplication.
+    Metrics: configuration values for the run reports.
     datasets: collection of configuration values."""
 
 import os
@@ -46,9 +53,23 @@ class S3:
         Exports (dict[str]): exports objects.
         Local_Commerce (dict[str]): local commerce objects.
         Korea_Imports (dict[str]): korea imports objects.
+        Endpoint_Url (str | None): custom S3 endpoint, e.g. a local MinIO,
+          taken from the S3_ENDPOINT_URL environment variable.
+        Max_Workers (int): parallel object transfers.
+        Max_Pool_Connections (int): connections kept by the shared client.
+        Multipart_Threshold (int): file size in bytes from which transfers
+          are split in parts.
+        Multipart_Chunksize (int): size in bytes of each part.
+        Max_Concurrency (int): parallel parts per transferred object.
     """
 
     Bucket = "talento-tech-project"
+    Endpoint_Url = os.environ.get("S3_ENDPOINT_URL")
+    Max_Workers = 8
+    Max_Pool_Connections = 64
+    Multipart_Threshold = 64 * 1024**2
+    Multipart_Chunksize = 16 * 1024**2
+    Max_Concurrency = 8
     Exports = {
         "raw": "exports/raw/",
         "clean": "exports/clean/",
@@ -73,35 +94,40 @@ class Local_Dir:
 
     Exports = {
         "raw": Data + S3.Exports["raw"],
+        "stage": Data + "exports/stage/",
         "clean": Data + S3.Exports["clean"],
+        "rejects": Data + "exports/rejects/",
+        "manifest": Data + "exports/manifest.json",
     }
 
     Korea_Imports = {
         "raw": Data + S3.Korea_Imports["raw"],
+        "stage": Data + "korea-imports/stage/",
         "clean": Data + S3.Korea_Imports["clean"],
+        "rejects": Data + "korea-imports/rejects/",
+        "manifest": Data + "korea-imports/manifest.json",
     }
 
 
-class Filename:
-    """Filename for processed data.
-
-    Attributes:
-        Exports (dict[str]): exports processed data.
-        Local_Commerce (dict[str]): local commerce processed data.
-        Korea_Imports (dict[str]): korea imports processed data.
-    """
-
-    Exports = {"clean": "clean_exports.parquet"}
-
-    Korea_Imports = {"clean": "clean_koreaimports.parquet"}
-
-
 class Exports:
     """Exports relevant arguments.
 
     Attributes:
         Columns_To_Drop (list[str]): columns from raw data to drop.
+        Csv_Schema (dict): how to parse the raw .csv files. "types" maps
+          column names to the pyarrow type they are parsed as, other columns
+          are sniffed. A None "delimiter" is sniffed. "thousands" is the
+          separator stripped from numbers before they are parsed, None if
+          numbers have none.
         Dtypes (list[tuple]): column-dtype pairs to cast clean data.
+          Low cardinality columns are dictionaries, stored as ENUM in
+          duckdb tables, and monetary columns are fixed-point decimals.
+        Dictionary_Cols (list[str]): low cardinality columns to dictionary
+          encode in parquet.
+        Partition_Cols (list[str]): columns the clean dataset is hive
+          partitioned by.
+        Dedup_Keys (list[str] | None): columns identifying a row when
+          deduplicating. None uses all columns.
     """
 
     Columns_To_Drop = [
@@ -133,14 +159,34 @@ class Exports:
         "AGRENA",
     ]
 
+    Csv_Schema = {
+        "types": {
+            "COD_PAI4": pa.string(),
+            "POSAR": pa.string(),
+            "DPTO1": pa.uint8(),
+            "FOBPES": pa.decimal128(18, 2),
+            "AGRENA": pa.decimal128(18, 2),
+        },
+        "delimiter": None,
+        "decimal": ",",
+        "thousands": ".",
+        "encoding": "utf-8",
+    }
+
     Dtypes = [
-        ("COD_PAI4", pa.string()),
+        ("COD_PAI4", pa.dictionary(pa.int16(), pa.string())),
         ("POSAR", pa.uint8()),
         ("DPTO1", pa.uint8()),
-        ("FOBPES", pa.float64()),
-        ("AGRENA", pa.float64()),
+        ("FOBPES", pa.decimal128(18, 2)),
+        ("AGRENA", pa.decimal128(18, 2)),
     ]
 
+    Dictionary_Cols = ["COD_PAI4", "POSAR"]
+
+    Partition_Cols = ["DPTO1"]
+
+    Dedup_Keys = None
+
     Commoditie_Code_Format = {
         "commoditie-col": "POSAR",
         "pad": True,
@@ -157,7 +203,20 @@ class Korea_Imports:
 
     Attributes:
         Columns_To_Drop (list[str]): columns from raw data to drop.
+        Csv_Schema (dict): how to parse the raw .csv files. "types" maps
+          column names to the pyarrow type they are parsed as, other columns
+          are sniffed. A None "delimiter" is sniffed. "thousands" is the
+          separator stripped from numbers before they are parsed, None if
+          numbers have none.
         Dtypes (list[tuple]): column-dtype pairs to cast clean data.
+          Low cardinality columns are dictionaries, stored as ENUM in
+          duckdb tables, and monetary columns are fixed-point decimals.
+        Dictionary_Cols (list[str]): low cardinality columns to dictionary
+          encode in parquet.
+        Partition_Cols (list[str]): columns the clean dataset is hive
+          partitioned by.
+        Dedup_Keys (list[str] | None): columns identifying a row when
+          deduplicating. None uses all columns.
     """
 
     Columns_To_Drop = [
@@ -209,12 +268,30 @@ class Korea_Imports:
 
     Monetary_Cols = ["primaryValue"]
 
+    Csv_Schema = {
+        "types": {
+            "partnerDesc": pa.string(),
+            "cmdCode": pa.string(),
+            "primaryValue": pa.decimal128(18, 2),
+        },
+        "delimiter": None,
+        "decimal": ".",
+        "thousands": None,
+        "encoding": "utf-8",
+    }
+
     Dtypes = [
-        ("partnerDesc", pa.string()),
+        ("partnerDesc", pa.dictionary(pa.int16(), pa.string())),
         ("cmdCode", pa.uint8()),
-        ("primaryValue", pa.float64()),
+        ("primaryValue", pa.decimal128(18, 2)),
     ]
 
+    Dictionary_Cols = ["partnerDesc", "cmdCode"]
+
+    Partition_Cols = ["cmdCode"]
+
+    Dedup_Keys = None
+
     Commoditie_Code_Format = {
         "commoditie-col": "cmdCode",
         "pad": True,
@@ -226,15 +303,205 @@ class Korea_Imports:
     }
 
 
+class Execution:
+    """Cleaning execution relevant arguments.
+
+    Attributes:
+        Mode (str): how the Load chain is executed. "sql" compiles the chain
+          into a single lazy duckdb relation that is only materialized when
+          written to parquet; "arrow" runs it on a pyarrow table with
+          pyarrow.compute kernels; "pandas" materializes it through pyarrow
+          and pandas.
+        Remote_Read (bool): whether to scan the raw .csv files directly from
+          S3 through duckdb httpfs instead of downloading them first.
+        Jobs (int): maximum number of datasets cleaned at the same time.
+        File_Jobs (int): maximum number of raw files of a dataset cleaned
+          at the same time.
+    """
+
+    Mode = "sql"
+    Remote_Read = False
+    Jobs = 2
+    File_Jobs = os.cpu_count() or 1
+
+
+class Parquet:
+    """Parquet writing relevant arguments.
+
+    Attributes:
+        Batch_Size (int): rows per record batch fetched from duckdb.
+        Row_Group_Size (int): maximum number of rows per parquet row group.
+        Compression (str): parquet compression codec.
+    """
+
+    Batch_Size = 122_880
+    Row_Group_Size = 1_000_000
+    Compression = "zstd"
+
+
+class Resources:
+    """Resource budget of the ingest and transform phases.
+
+    The budget is shared by the processes of a phase running at the same
+    time, each gets an equal share of the memory and threads (see
+    load.set_resources). The dashboard has its own budget (see Dashboard),
+    so a phase and the dashboard can run side by side on the same machine
+    within Memory_Limit plus Dashboard.Memory_Limit.
+
+    Attributes:
+        Memory_Limit (str): duckdb memory limit of a phase, as "4GB" or
+          "4GiB". Over it, duckdb spills to Temp_Dir. pyarrow and pandas
+          memory isn't limited, so the "arrow" and "pandas" execution
+          modes still hold each raw file in memory.
+        Threads (int): duckdb and pyarrow threads of a phase.
+        Temp_Dir (str): directory duckdb spills to. Each process spills
+          to its own subdirectory.
+        Memory_Pool (str | None): pyarrow memory pool, "system", "jemalloc"
+          or "mimalloc". None keeps the pyarrow default.
+    """
+
+    Memory_Limit = "4GB"
+    Threads = os.cpu_count() or 1
+    Temp_Dir = Local_Dir.Data + "tmp/"
+    Memory_Pool = None
+
+
+class Transform:
+    """Transform execution relevant arguments.
+
+    Attributes:
+        Jobs (int): maximum number of tables built at the same time.
+        State (str): json file recording what each table was built from.
+        Source_Views (bool): whether the tables read from the clean
+          parquet datasets are views over them, instead of copies. The
+          database gets much smaller, but it's only readable where the
+          datasets are, relative to the working directory.
+        Compact_Free (float): share of free blocks over which the database
+          file is rewritten after a build, e.g. once Source_Views replaced
+          the source tables with views.
+    """
+
+    Jobs = 4
+    Source_Views = False
+    State = os.path.join(Database.dir, "state.json")
+    Compact_Free = 0.4
+
+
+class Cluster:
+    """Clustering relevant arguments of the transform phase.
+
+    Attributes:
+        K (list[int]): candidate numbers of clusters of each model.
+        Aggregate (bool): whether the cluster tables cluster aggregates
+          by commodity code, and partner, computed in duckdb, instead of
+          every transaction row (see tables.cluster_declaration). Training
+          data and cluster tables shrink to one row per aggregate.
+        Selection (str): how the number of clusters is chosen among K,
+          "elbow" on the inertia or the best "silhouette" score.
+        Sample_Rows (int): rows of the sample the candidates are fitted
+          and scored on.
+        Mini_Batch_Rows (int): rows over which the chosen model is fitted
+          with MiniBatchKMeans instead of KMeans.
+        Batch_Size (int): rows per MiniBatchKMeans batch.
+        Jobs (int): processes fitting the candidates of all models, on a
+          thread each. They're charged half the threads of the Resources
+          budget, so while cluster tables are declared the transform
+          connection gets the other half of the threads and memory.
+        Seed (int): random seed of the samples and fits.
+    """
+
+    K = list(range(1, 10))
+    Aggregate = False
+    Selection = "elbow"
+    Sample_Rows = 10_000
+    Mini_Batch_Rows = 200_000
+    Batch_Size = 4_096
+    Jobs = max(1, Resources.Threads // 2)
+    Seed = 0
+
+
+class Dashboard:
+    """Dashboard relevant arguments.
+
+    Attributes:
+        Database (str): duckdb database the dashboard reads.
+        Snapshot (str): directory of the charts data snapshot, written by
+          the transform phase and read by the dashboard on startup.
+        Cache_Ttl (int): seconds a query result stays cached.
+        Cache_Entries (int): maximum number of query results cached.
+        Scatter_Points (int): maximum number of points of a scatter chart.
+          Larger tables are sampled down to it.
+        Memory_Limit (str): duckdb memory limit of the dashboard connection.
+        Threads (int): duckdb threads of the dashboard connection.
+        Temp_Dir (str): directory the dashboard connection spills to.
+        Page_Size (int): rows per page of the SQL explorer.
+        Max_Rows (int): maximum number of rows the SQL explorer serves
+          across all pages of a query.
+        Timeout (float): seconds before a SQL explorer query is interrupted.
+    """
+
+    Database = "./data/transformed/db.duckdb"
+    Snapshot = "./data/transformed/snapshot/"
+    Cache_Ttl = 3600
+    Cache_Entries = 64
+    Scatter_Points = 5_000
+    Memory_Limit = "1GB"
+    Threads = 2
+    Temp_Dir = Resources.Temp_Dir + "dashboard/"
+    Page_Size = 100
+    Max_Rows = 10_000
+    Timeout = 10.0
+
+
+class Dedup:
+    """Deduplication relevant arguments.
+
+    Attributes:
+        Fingerprint_Bits (int | None): bits of the fingerprint the dedup
+          keys are compared by, 64 or 128. None compares them exactly.
+          Fingerprints only apply with dedup keys, and only shrink the dedup
+          state when the keys are wide, see Load.purge_duplicates.
+    """
+
+    Fingerprint_Bits = None
+
+
+class Metrics:
+    """Run reports relevant arguments.
+
+    Attributes:
+        Enabled (bool): whether the ingest stages are recorded.
+        Dir (str): directory of the run reports, one folder per dataset.
+        Open_Metrics (bool): whether run reports are also saved as
+          OpenMetrics text, next to the json report.
+        Regression_Factor (float): times slower than in the previous run
+          a stage has to be to be printed as a regression.
+        Regression_Min (float): seconds a stage has to take to be checked
+          for regressions, so noise in short stages isn't reported.
+    """
+
+    Enabled = True
+    Dir = Local_Dir.Data + "metrics/"
+    Open_Metrics = False
+    Regression_Factor = 1.5
+    Regression_Min = 0.5
+
+
 datasets: dict[str, dict[str, typing.Any]] = {
     "exports": {
         "s3-raw": S3.Exports["raw"],
         "local-raw": Local_Dir.Exports["raw"],
         "s3-clean": S3.Exports["clean"],
+        "local-stage": Local_Dir.Exports["stage"],
         "local-clean": Local_Dir.Exports["clean"],
-        "filename-clean": Filename.Exports["clean"],
+        "local-rejects": Local_Dir.Exports["rejects"],
+        "manifest": Local_Dir.Exports["manifest"],
         "drop-cols": Exports.Columns_To_Drop,
+        "csv-schema": Exports.Csv_Schema,
         "dtypes": Exports.Dtypes,
+        "dictionary-cols": Exports.Dictionary_Cols,
+        "partition-cols": Exports.Partition_Cols,
+        "dedup-keys": Exports.Dedup_Keys,
         "monetary-cols": Exports.Monetary_Cols,
         "commoditie-col-format": Exports.Commoditie_Code_Format,
     },
@@ -242,10 +509,16 @@ datasets: dict[str, dict[str, typing.Any]] = {
         "s3-raw": S3.Korea_Imports["raw"],
         "local-raw": Local_Dir.Korea_Imports["raw"],
         "s3-clean": S3.Korea_Imports["clean"],
+        "local-stage": Local_Dir.Korea_Imports["stage"],
         "local-clean": Local_Dir.Korea_Imports["clean"],
-        "filename-clean": Filename.Korea_Imports["clean"],
+        "local-rejects": Local_Dir.Korea_Imports["rejects"],
+        "manifest": Local_Dir.Korea_Imports["manifest"],
         "drop-cols": Korea_Imports.Columns_To_Drop,
+        "csv-schema": Korea_Imports.Csv_Schema,
         "dtypes": Korea_Imports.Dtypes,
+        "dictionary-cols": Korea_Imports.Dictionary_Cols,
+        "partition-cols": Korea_Imports.Partition_Cols,
+        "dedup-keys": Korea_Imports.Dedup_Keys,
         "monetary-cols": Korea_Imports.Monetary_Cols,
         "commoditie-col-format": Korea_Imports.Commoditie_Code_Format,
     },
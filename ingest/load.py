@@ -6,21 +6,250 @@ Attributes:
     unify_csv: creates a duckdb relation from all .csv files in a given directory.
     Load: class that instantiates a duckdb relation a uses pyarrow tables and pandas
       dataframes and s3 to clean and load the data.
+    to_duckdb_type: maps a pyarrow data type to its duckdb sql type.
+    create_table: creates a duckdb table with dictionary columns as ENUM types.
+    quote: quotes a column name to be used as a duckdb identifier.
+    is_dataframe: whether data is a pandas dataframe, without importing pandas.
+    parse_size: parses a duckdb memory size into bytes.
+    set_resources: applies the share of the resource budget of a process.
+    save_rejects: saves the rows rejected by unify_csv to a parquet file.
+    dedup_partitions: deduplicates the stale partitions of a staged dataset.
+    write_record_batches: streams record batches to a parquet file by row groups.
+
+pandas, pyarrow.compute and pyarrow.dataset are only imported by the
+methods using them, as importing pandas takes most of the import time,
+and pyarrow.dataset imports pandas too.
 """
 
+from __future__ import annotations
+
 import os
+import re
+import sys
+import glob
+import atexit
+import shutil
+import typing
 import config
-import pandas as pd
+import s3
+import metrics
 import pyarrow as pa
-import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import duckdb
 
+if typing.TYPE_CHECKING:
+    import pandas as pd
+
+
+DUCKDB_TYPES = {
+    pa.string(): "VARCHAR",
+    pa.large_string(): "VARCHAR",
+    pa.bool_(): "BOOLEAN",
+    pa.int8(): "TINYINT",
+    pa.int16(): "SMALLINT",
+    pa.int32(): "INTEGER",
+    pa.int64(): "BIGINT",
+    pa.uint8(): "UTINYINT",
+    pa.uint16(): "USMALLINT",
+    pa.uint32(): "UINTEGER",
+    pa.uint64(): "UBIGINT",
+    pa.float32(): "FLOAT",
+    pa.float64(): "DOUBLE",
+    pa.date32(): "DATE",
+}
+"""dict[pa.DataType, str]: pyarrow data types and their duckdb sql equivalent."""
+
+
+def to_duckdb_type(dtype: pa.DataType) -> str:
+    """Maps a pyarrow data type to its duckdb sql type.
+
+    Dictionary types map to their value type, since a duckdb ENUM needs
+    its values upfront. Dictionaries are applied when the data leaves
+    duckdb (see Load.get_record_batch_reader and create_table).
+
+    Args:
+        dtype (pa.DataType): pyarrow data type.
+
+    Returns:
+        The duckdb sql type name.
+
+    Raises:
+        TypeError: if the data type has no duckdb equivalent.
+    """
+    if pa.types.is_dictionary(dtype):
+        return to_duckdb_type(dtype.value_type)
+    if pa.types.is_decimal(dtype) and dtype.precision <= 38:
+        return f"DECIMAL({dtype.precision}, {dtype.scale})"
+    try:
+        return DUCKDB_TYPES[dtype]
+    except KeyError:
+        raise TypeError(f"pyarrow type {dtype} has no duckdb equivalent") from None
+
+
+def quote(column: str) -> str:
+    """Quotes a column name to be used as a duckdb identifier."""
+    return '"' + column.replace('"', '""') + '"'
+
+
+def is_dataframe(data) -> bool:
+    """Whether data is a pandas dataframe, without importing pandas.
+
+    If pandas wasn't imported yet, data can't be a dataframe.
+    """
+    pandas = sys.modules.get("pandas")
+    return pandas is not None and isinstance(data, pandas.DataFrame)
+
+
+SIZE_UNITS = {
+    "": 1,
+    "B": 1,
+    "KB": 1000,
+    "MB": 1000**2,
+    "GB": 1000**3,
+    "TB": 1000**4,
+    "KIB": 1024,
+    "MIB": 1024**2,
+    "GIB": 1024**3,
+    "TIB": 1024**4,
+}
+
+
+def parse_size(size: str) -> int:
+    """Parses a duckdb memory size, as "4GB" or "512MiB", into bytes.
 
-def unify_csv(source_dir: str) -> duckdb.DuckDBPyRelation:
+    Args:
+        size (str): memory size.
+
+    Raises:
+        ValueError: if size isn't a number followed by a duckdb size unit.
+    """
+    match = re.fullmatch(r"\s*([\d.]+)\s*([a-zA-Z]*)\s*", size)
+    if match is None or match[2].upper() not in SIZE_UNITS:
+        raise ValueError(f"Memory size '{size}' is not supported")
+    return int(float(match[1]) * SIZE_UNITS[match[2].upper()])
+
+
+def set_resources(connection: duckdb.DuckDBPyConnection, processes: int = 1):
+    """Applies the share of the config.Resources budget of a process.
+
+    The duckdb connection gets an equal share of the memory limit and
+    threads among the processes running at the same time, and spills to
+    a directory of its own, removed when the process exits. pyarrow gets
+    the same threads.
+
+    Args:
+        connection (DuckDBPyConnection): duckdb connection to configure.
+        processes (int): processes sharing the budget at the same time.
+    """
+    processes = max(1, processes)
+    memory = parse_size(config.Resources.Memory_Limit) // processes
+    threads = max(1, config.Resources.Threads // processes)
+    temp_dir = os.path.join(config.Resources.Temp_Dir, str(os.getpid()))
+
+    connection.execute(
+        f"SET memory_limit = '{memory // 1024**2}MiB';SET threads = {threads};"
+    )
+    # duckdb can't switch its temp directory once it spilled, even to itself.
+    current = connection.sql("SELECT current_setting('temp_directory')").fetchone()
+    if current is None or current[0] != temp_dir:
+        os.makedirs(temp_dir, exist_ok=True)
+        atexit.register(shutil.rmtree, temp_dir, ignore_errors=True)
+        connection.execute(f"SET temp_directory = '{temp_dir}'")
+
+    pa.set_cpu_count(threads)
+    pa.set_io_thread_count(threads)
+    if config.Resources.Memory_Pool is not None:
+        pa.set_memory_pool(getattr(pa, f"{config.Resources.Memory_Pool}_memory_pool")())
+
+
+def create_table(
+    connection: duckdb.DuckDBPyConnection,
+    table: str,
+    query: str,
+    dtypes: list[tuple],
+    view: bool = False,
+):
+    """Creates or replaces a duckdb table from a query.
+
+    Each dictionary typed column of dtypes is stored as an ENUM type,
+    named after the table and the column, holding its sorted distinct
+    values. Other columns keep the types of the query.
+
+    As a view, nothing is copied into the database and the query runs
+    whenever the view is read. Views keep the types of the query, so
+    filters on a parquet scan are pushed down to its row group statistics.
+    A table or view with the same name is replaced by either.
+
+    Typical example:
+        create_table(
+            connection,
+            "valle_exports",
+            "SELECT * FROM read_parquet('./data/exports/clean/*/*.parquet')",
+            config.Exports.Dtypes,
+        )
+
+    Args:
+        connection (DuckDBPyConnection): duckdb connection.
+        table (str): table name.
+        query (str): query selecting the table rows.
+        dtypes (list[tuple]): column-dtype pairs, as config.Exports.Dtypes.
+        view (bool): whether to create a view instead of a table.
+    """
+    other = connection.execute(
+        "SELECT table_name FROM duckdb_tables() WHERE table_name = $name"
+        if view
+        else "SELECT view_name FROM duckdb_views() WHERE view_name = $name",
+        {"name": table},
+    ).fetchall()
+    if other:
+        connection.execute(f"DROP {'TABLE' if view else 'VIEW'} {quote(table)}")
+    if view:
+        connection.execute(f"CREATE OR REPLACE VIEW {quote(table)} AS {query}")
+        return
+
+    enums = {}
+    for column, dtype in dtypes:
+        if pa.types.is_dictionary(dtype):
+            enums[column] = quote(f"{table}_{column}")
+            connection.execute(
+                f"""CREATE OR REPLACE TYPE {enums[column]} AS ENUM (
+                SELECT DISTINCT CAST({quote(column)} AS VARCHAR)
+                FROM ({query})
+                WHERE {quote(column)} IS NOT NULL
+                ORDER BY 1
+                )"""
+            )
+
+    replace = ", ".join(
+        f"CAST({quote(column)} AS {enum}) AS {quote(column)}"
+        for column, enum in enums.items()
+    )
+    connection.execute(
+        f"""CREATE OR REPLACE TABLE {quote(table)}
+        AS SELECT * {f"REPLACE ({replace})" if replace else ""}
+        FROM ({query})"""
+    )
+
+
+@metrics.stage("unify_csv")
+def unify_csv(
+    source_dir: str | list[str], schema: dict | None = None
+) -> duckdb.DuckDBPyRelation:
     """Creates a duckdb relation from all .csv files in a given directory.
 
+    Directories and files can be s3:// paths, in which case they are
+    scanned remotely through duckdb httpfs, without staging them on disk.
+
+    With a schema, the typed columns are parsed in a single pass and rows
+    that don't fit it are stored in duckdb rejects tables (see save_rejects).
+    Thousands separators are stripped while parsing, so "1.234,56" with a
+    decimal comma is read as 1234.56 instead of being rejected.
+    Without it, types are sniffed and bad rows are silently ignored.
+
     Args:
-        source_dir (str): directory where the .csv files are located.
+        source_dir (str | list[str]): directory where the .csv files are located,
+          or a list of .csv files to unify.
+        schema (dict): how to parse the files, as config.Exports.Csv_Schema.
 
     Returns:
         A duckdb relation
@@ -30,7 +259,37 @@ def unify_csv(source_dir: str) -> duckdb.DuckDBPyRelation:
           since this error is non-recoverable.
     """
     try:
-        data = duckdb.read_csv(source_dir + "*.csv", ignore_errors=True)
+        if isinstance(source_dir, str):
+            source_dir = source_dir + "*.csv"
+        paths = [source_dir] if isinstance(source_dir, str) else source_dir
+        metrics.count(
+            bytes_read=sum(
+                os.path.getsize(file)
+                for path in paths
+                if not path.startswith("s3://")
+                for file in glob.glob(path)
+            )
+        )
+        if any(path.startswith("s3://") for path in paths):
+            s3.register_duckdb_secret(duckdb.default_connection())
+        if schema is None:
+            return duckdb.read_csv(source_dir, ignore_errors=True)
+
+        options = {
+            "header": True,
+            "dtype": {
+                column: to_duckdb_type(dtype)
+                for column, dtype in schema["types"].items()
+            },
+            "decimal": schema["decimal"],
+            "encoding": schema["encoding"],
+            "store_rejects": True,
+        }
+        if schema["delimiter"] is not None:
+            options["sep"] = schema["delimiter"]
+        if schema["thousands"] is not None:
+            options["thousands"] = schema["thousands"]
+        data = duckdb.read_csv(source_dir, **options)
         return data
     except Exception as e:
         print(
@@ -40,17 +299,72 @@ def unify_csv(source_dir: str) -> duckdb.DuckDBPyRelation:
         raise
 
 
+@metrics.stage("save_rejects")
+def save_rejects(dir: str, filename: str) -> int:
+    """Saves the rows rejected by typed unify_csv scans to a parquet file.
+
+    Rejects are moved out of the duckdb rejects tables, so the next call
+    only sees rows rejected after this one. If there aren't any, a previous
+    rejects file with the same name is removed.
+
+    Args:
+        dir (str): storage directory.
+        filename (str): parquet file filename.
+
+    Returns:
+        The number of rejected rows.
+    """
+    connection = duckdb.default_connection()
+    tables = connection.sql(
+        "SELECT table_name FROM duckdb_tables() WHERE table_name = 'reject_errors'"
+    ).fetchall()
+    if not tables:
+        return 0
+
+    rejects = connection.sql(
+        """SELECT scans.file_path, errors.*
+        FROM reject_errors errors
+        JOIN reject_scans scans USING (scan_id, file_id)"""
+    )
+    count = rejects.aggregate("count(*)").fetchone()[0]  # type: ignore
+    if count:
+        config.check_dir_exists(dir)
+        rejects.write_parquet(dir + filename)
+    elif os.path.exists(dir + filename):
+        os.remove(dir + filename)
+    connection.execute("DELETE FROM reject_errors; DELETE FROM reject_scans;")
+    metrics.count(rows_out=count)
+
+    print(f"{count} rows were rejected.\n")
+    return count
+
+
+@metrics.instrument
 class Load:
     """Collection of methods for cleaning and loading data.
 
     This class was made for allowing chaining methods
 
+    Methods that accept a duckdb relation don't execute anything, they
+    compose a lazy relation that is only materialized by save_to_parquet.
+    This way the whole chain runs inside duckdb.
+
+    Each public method call is recorded as a stage (see metrics.instrument).
+
     Typical example:
         data = Load(data=duckdb_rel)
         data = (
             data.get_pyarrow_table()
             .purge_nulls()
         )
+
+    SQL example:
+        data = Load(data=duckdb_rel)
+        data = (
+            data.purge_columns(columns)
+            .cast_dtypes(dtypes)
+            .purge_duplicates()
+        )
     """
 
     def __init__(self, data: duckdb.DuckDBPyRelation):
@@ -58,22 +372,74 @@ class Load:
 
         This constructor instantiates a duckdb relation.
 
+        dtypes keeps the pyarrow types cast by cast_dtypes, so the types
+        duckdb can't express lazily, as dictionaries, are applied when
+        the data is streamed out.
+
         Args:
             data (DuckDBPyRelation): data to clean and load.
         """
         self.data = data
+        self.dtypes: dict[str, pa.DataType] = {}
 
     def get_pyarrow_table(self: duckdb.DuckDBPyRelation) -> pa.Table:  # type: ignore
         """Creates a pyarrow table from a DuckDBPyRelation."""
         self.data = self.data.arrow()  # type: ignore
         return self
 
-    def show_info(self: pa.Table | pd.DataFrame) -> None:
+    def get_record_batch_reader(
+        self: duckdb.DuckDBPyRelation | pd.DataFrame | pa.Table | pa.RecordBatchReader,
+    ) -> pa.RecordBatchReader:  # type: ignore
+        """Creates a pyarrow record batch reader from the actual Load instance.
+
+        Columns cast by cast_dtypes are streamed with their pyarrow types.
+        """
+        if isinstance(self.data, duckdb.DuckDBPyRelation):
+            reader = self.data.fetch_arrow_reader(batch_size=config.Parquet.Batch_Size)
+        elif is_dataframe(self.data):
+            reader = pa.Table.from_pandas(self.data, preserve_index=False).to_reader()
+        elif isinstance(self.data, pa.Table):
+            reader = self.data.to_reader()
+        else:
+            reader = self.data
+
+        schema = pa.schema(
+            [
+                field.with_type(self.dtypes.get(field.name, field.type))
+                for field in reader.schema
+            ]
+        )
+        self.data = reader if schema == reader.schema else reader.cast(schema)
+        return self
+
+    def _project(self, expressions: dict[str, str]):
+        """Replaces columns of the duckdb relation with sql expressions.
+
+        Columns not in expressions are kept as they are.
+
+        Args:
+            expressions (dict[str, str]): column-expression pairs.
+        """
+        self.data = self.data.project(
+            ", ".join(
+                f"{expressions[column]} AS {quote(column)}"
+                if column in expressions
+                else quote(column)
+                for column in self.data.columns
+            )
+        )
+
+    def show_info(self: pa.Table | pd.DataFrame | duckdb.DuckDBPyRelation) -> None:
         """Shows informationo about the actual Load instance.
 
-        It can be a pyarrow table or pandas dataframe.
+        It can be a pyarrow table, pandas dataframe or duckdb relation.
+        For a duckdb relation the shape is not shown, since it would
+        execute the query.
         """
-        if isinstance(self.data, pd.DataFrame):
+        if isinstance(self.data, duckdb.DuckDBPyRelation):
+            for column, dtype in zip(self.data.columns, self.data.types):
+                print(column, ": ", dtype, sep="")
+        elif is_dataframe(self.data):
             print(self.data.info())
             print(self.data.shape)
         else:
@@ -82,31 +448,69 @@ class Load:
                 print(self.data.column(column).type)
             print(self.data.shape)
 
-    def purge_columns(self: pa.Table, columns: list[str]) -> pa.Table:
+    def purge_columns(
+        self: pa.Table | duckdb.DuckDBPyRelation, columns: list[str]
+    ) -> pa.Table | duckdb.DuckDBPyRelation:
         """Drops a list of given columns.
 
-        Instance must be a pyarrow table.
+        Instance must be a pyarrow table or duckdb relation.
 
         Args:
             columns (list[str]): columns to drop.
+
+        Raises:
+            KeyError: if a column to drop doesn't exist in the duckdb relation.
         """
-        self.data = self.data.drop_columns(columns)
+        if isinstance(self.data, duckdb.DuckDBPyRelation):
+            missing = set(columns) - set(self.data.columns)
+            if missing:
+                raise KeyError(f"Columns {sorted(missing)} don't exist")
+            self.data = self.data.project(
+                ", ".join(
+                    quote(column)
+                    for column in self.data.columns
+                    if column not in columns
+                )
+            )
+        else:
+            self.data = self.data.drop_columns(columns)
         return self
 
     def cast_dtypes(
-        self: pa.Table | pd.DataFrame, dtypes: list[tuple]
-    ) -> pa.Table | pd.DataFrame:
+        self: pa.Table | pd.DataFrame | duckdb.DuckDBPyRelation, dtypes: list[tuple]
+    ) -> pa.Table | pd.DataFrame | duckdb.DuckDBPyRelation:
         """Casts dtypes.
 
-        Instance must be a pyarrow table or pandas dataframe.
+        Instance must be a pyarrow table, pandas dataframe or duckdb relation.
+
+        Besides pyarrow types with a duckdb equivalent, dtypes can be
+        dictionaries, for low cardinality columns, and decimals, for
+        fixed-point monetary values. A duckdb relation keeps dictionary
+        columns as their value type until it's streamed out.
 
         Args:
             dtypes (list[tuple]): column-dtype pairs to cast.
         """
-        if isinstance(self.data, pa.Table):
-            schema = pa.schema(dtypes)
+        self.dtypes.update(dtypes)
+        if isinstance(self.data, duckdb.DuckDBPyRelation):
+            self._project(
+                {
+                    column: f"CAST({quote(column)} AS {to_duckdb_type(dtype)})"
+                    for column, dtype in dtypes
+                }
+            )
+        elif isinstance(self.data, pa.Table):
+            types = dict(dtypes)
+            schema = pa.schema(
+                [
+                    field.with_type(types.get(field.name, field.type))
+                    for field in self.data.schema
+                ]
+            )
             self.data = self.data.cast(target_schema=schema)
         else:
+            import pandas as pd
+
             for column in dtypes:
                 self.data[column[0]] = self.data[column[0]].astype(
                     dtype=pd.ArrowDtype(column[1])
@@ -124,23 +528,96 @@ class Load:
     # Here I used dataframes because I needed a row approach, instead of a columnar one
     def table_to_dataframe(self: pa.Table) -> pd.DataFrame:
         """Casts pyarrow table to pandas dataframe."""
+        import pandas as pd
+
         self.data = self.data.to_pandas(types_mapper=pd.ArrowDtype)
         return self
 
-    def purge_duplicates(self: pd.DataFrame) -> pd.DataFrame:  # type: ignore
+    def _set_column(self: pa.Table, column: str, values: pa.ChunkedArray):  # type: ignore
+        """Replaces a column of the pyarrow table."""
+        self.data = self.data.set_column(
+            self.data.schema.get_field_index(column), column, values
+        )
+
+    def purge_duplicates(
+        self: pd.DataFrame | duckdb.DuckDBPyRelation | pa.Table,
+        keys: list[str] | None = None,
+        fingerprint_bits: int | None = None,
+    ) -> pd.DataFrame | duckdb.DuckDBPyRelation | pa.Table:  # type: ignore
         """Purges duplicated rows.
 
-        Instance must be pandas dataframe.
+        Instance must be pandas dataframe, duckdb relation or pyarrow table.
+
+        Rows are duplicated if their key columns are equal. Without keys,
+        rows are always compared exactly, by all their columns.
+
+        With keys and fingerprint_bits, rows are grouped by a hash of their
+        key columns instead of the columns themselves. The dedup state
+        still holds the first row of each group, only its group key
+        shrinks to 8 or 16 bytes, so fingerprints only pay off for wide
+        keys, like long strings. Rows whose fingerprints collide are
+        merged even if their keys differ: 128 bits make it negligible, 64
+        bits are only safe up to some hundred million distinct keys.
+
+        A pyarrow table is deduplicated by duckdb, which scans it without
+        copying.
+
+        Args:
+            keys (list[str]): columns identifying a row. If None, all columns.
+            fingerprint_bits (int): 64 or 128 to compare keys by fingerprint.
+              If None or without keys, rows are compared exactly.
+
+        Raises:
+            ValueError: if fingerprint_bits isn't None, 64 or 128.
         """
-        self.data = self.data.drop_duplicates()
+        if fingerprint_bits not in (None, 64, 128):
+            raise ValueError(f"Fingerprints of {fingerprint_bits} bits not supported")
+        if keys is None:
+            fingerprint_bits = None
+
+        if isinstance(self.data, pa.Table):
+            self.data = duckdb.from_arrow(self.data)
+            self.purge_duplicates(keys, fingerprint_bits)
+            self.data = self.data.arrow()
+        elif isinstance(self.data, duckdb.DuckDBPyRelation):
+            if keys is None:
+                self.data = self.data.distinct()
+            else:
+                columns = ", ".join(quote(column) for column in keys)
+                if fingerprint_bits == 64:
+                    distinct_on = f"hash({columns})"
+                elif fingerprint_bits == 128:
+                    distinct_on = f"md5_number(CAST(row({columns}) AS VARCHAR))"
+                else:
+                    distinct_on = columns
+                self.data = self.data.query(
+                    "data", f"SELECT DISTINCT ON ({distinct_on}) * FROM data"
+                )
+        elif fingerprint_bits is None:
+            self.data = self.data.drop_duplicates(subset=keys)
+        else:
+            import pandas as pd
+
+            fingerprint = pd.DataFrame(
+                {
+                    key: pd.util.hash_pandas_object(
+                        self.data[keys], index=False, hash_key=key
+                    )
+                    for key in ["0123456789abcdef", "fedcba9876543210"][
+                        : fingerprint_bits // 64
+                    ]
+                }
+            )
+            self.data = self.data[~fingerprint.duplicated().to_numpy()]
         return self
 
     def fix_monetary_punctuation(
-        self: pd.DataFrame, monetary_columns: list[str]
-    ) -> pd.DataFrame:  # type: ignore
+        self: pd.DataFrame | duckdb.DuckDBPyRelation | pa.Table,
+        monetary_columns: list[str],
+    ) -> pd.DataFrame | duckdb.DuckDBPyRelation | pa.Table:  # type: ignore
         """Replace commas for dots in strings representing monetary values.
 
-        Instance must be pandas dataframe.
+        Instance must be pandas dataframe, duckdb relation or pyarrow table.
 
         Regex selects all commas and replace them with a empty string.
         This avoids compatibility issues at the time of dtype casting.
@@ -148,6 +625,28 @@ class Load:
         Args:
             monetary_column (str): column name to fix.
         """
+        if isinstance(self.data, duckdb.DuckDBPyRelation):
+            self._project(
+                {
+                    column: f"regexp_replace(CAST({quote(column)} AS VARCHAR), '[,.].', '', 'g')"
+                    for column in monetary_columns
+                }
+            )
+            return self
+
+        if isinstance(self.data, pa.Table):
+            import pyarrow.compute as pc
+
+            for column in monetary_columns:
+                values = pc.cast(self.data.column(column), pa.string())
+                self._set_column(
+                    column,
+                    pc.replace_substring_regex(values, pattern="[,.].", replacement=""),
+                )
+            return self
+
+        import pandas as pd
+
         for column in monetary_columns:
             if not isinstance(self.data[column], str):
                 self.data[column] = self.data[column].astype(
@@ -157,7 +656,7 @@ class Load:
         return self
 
     def format_commoditie_code(
-        self: pd.DataFrame,  # type: ignore
+        self: pd.DataFrame | duckdb.DuckDBPyRelation | pa.Table,  # type: ignore
         commoditie_col: str,
         pad_: bool = False,
         slice_: bool = False,
@@ -166,7 +665,89 @@ class Load:
         side: str = "left",
         fillchar: str = "",
         stop: int = 1,
-    ) -> pd.DataFrame:
+    ) -> pd.DataFrame | duckdb.DuckDBPyRelation | pa.Table:
+        """Formats the commoditie (HS) code column.
+
+        Instance must be pandas dataframe, duckdb relation or pyarrow table.
+
+        The code is stripped, optionally padded to a given width
+        and optionally sliced up to a given position.
+
+        Args:
+            commoditie_col (str): commoditie code column.
+            pad_ (bool): whether to pad or not the code.
+            slice_ (bool): whether to slice or not the code.
+            width (int): minimum width of the padded code.
+            side (str): side to pad, "left", "right" or "both". Both sides
+              are padded as str.center does, the same in every instance type.
+            fillchar (str): padding character.
+            stop (int): slice end position.
+
+        Raises:
+            ValueError: if side is not supported for a duckdb relation.
+        """
+        if isinstance(self.data, duckdb.DuckDBPyRelation):
+            expression = f"trim(CAST({quote(commoditie_col)} AS VARCHAR))"
+
+            if pad_:
+                if side == "left":
+                    padded = f"lpad({expression}, {width}, '{fillchar}')"
+                elif side == "right":
+                    padded = f"rpad({expression}, {width}, '{fillchar}')"
+                elif side == "both":
+                    # As str.center, odd widths get the odd fill character left.
+                    left = f"({width} - length({expression}) + {width % 2}) // 2"
+                    padded = (
+                        f"rpad(lpad({expression}, "
+                        f"CAST(length({expression}) + {left} AS INTEGER), "
+                        f"'{fillchar}'), {width}, '{fillchar}')"
+                    )
+                else:
+                    raise ValueError(f"Padding side '{side}' is not supported")
+                # duckdb pads truncate longer strings, pandas doesn't.
+                expression = (
+                    f"CASE WHEN length({expression}) >= {width} THEN {expression} "
+                    f"ELSE {padded} END"
+                )
+
+            if slice_:
+                expression = f"left({expression}, {stop})"
+
+            self._project({commoditie_col: expression})
+            return self
+
+        if isinstance(self.data, pa.Table):
+            import pyarrow.compute as pc
+
+            values = pc.utf8_trim_whitespace(
+                pc.cast(self.data.column(commoditie_col), pa.string())
+            )
+
+            if pad_:
+                pad = {
+                    "left": pc.utf8_lpad,
+                    "right": pc.utf8_rpad,
+                    "both": pc.utf8_center,
+                }[side]
+                if side == "both" and width % 2:
+                    # utf8_center gives odd widths the odd fill character
+                    # right, str.center left.
+                    values = pc.utf8_lpad(
+                        pad(values, width=width - 1, padding=fillchar),
+                        width=width,
+                        padding=fillchar,
+                    )
+                else:
+                    values = pad(values, width=width, padding=fillchar)
+
+            if slice_:
+                values = pc.utf8_slice_codeunits(values, start=0, stop=stop)
+
+            self._set_column(commoditie_col, values)
+            return self
+
+        import pandas as pd
+
         if not isinstance(self.data[commoditie_col], str):
             self.data[commoditie_col] = self.data[commoditie_col].astype(
                 dtype=pd.ArrowDtype(pa.string())
@@ -184,24 +765,74 @@ class Load:
 
         return self
 
-    def save_to_parquet(self: pd.DataFrame, dir: str, filename: str):  # type: ignore
+    def save_to_parquet(
+        self: pd.DataFrame | duckdb.DuckDBPyRelation | pa.RecordBatchReader,
+        dir: str,
+        filename: str,
+        *,
+        row_group_size: int = config.Parquet.Row_Group_Size,
+        compression: str = config.Parquet.Compression,
+        dictionary_cols: list[str] | None = None,
+        overwrite: bool = False,
+    ):  # type: ignore
         """save data to parquet file.
 
-        Instance must be a pandas dataframe. If there's data in the given
-          storage directory nothing is saved.
+        Instance must be a pandas dataframe, duckdb relation or pyarrow
+          record batch reader. If there's data in the given storage
+          directory nothing is saved, unless overwrite is True.
+
+        With overwrite, only the given file is replaced, atomically,
+          so other partitions in the directory are left as they are.
+
+        A duckdb relation or record batch reader is streamed into the
+          parquet file by row groups, so memory doesn't grow with the data.
 
         Args:
             dir (str): storage directory.
             filename (str): parquet file filename.
+            row_group_size (int): maximum number of rows per row group.
+            compression (str): parquet compression codec.
+            dictionary_cols (list[str]): columns to dictionary encode.
+              If None, all columns are dictionary encoded.
+            overwrite (bool): whether to replace the file even if there's
+              data in the storage directory. default is False.
+
+        Raises:
+            ValueError: if there's no data to save.
         """
-        if self.data.empty:
+        is_stream = not is_dataframe(self.data)
+
+        if not is_stream and self.data.empty:
             raise ValueError("Dataframe for exporting to parquet cannot be empty")
 
         config.check_dir_exists(dir)
 
-        if not os.listdir(dir):
+        if overwrite or not os.listdir(dir):
             print("Saving to parquet...\n")
-            self.data.to_parquet(dir + filename, engine="pyarrow", index=False)
+            path = dir + filename + ".tmp"
+            if is_stream:
+                rows = write_record_batches(
+                    self.get_record_batch_reader().data,
+                    path,
+                    row_group_size=row_group_size,
+                    compression=compression,
+                    dictionary_cols=dictionary_cols,
+                )
+                if rows == 0:
+                    os.remove(path)
+                    raise ValueError("Data for exporting to parquet cannot be empty")
+            else:
+                rows = len(self.data)
+                self.data.to_parquet(
+                    path,
+                    engine="pyarrow",
+                    index=False,
+                    row_group_size=row_group_size,
+                    compression=compression,
+                    use_dictionary=True if dictionary_cols is None else dictionary_cols,
+                )
+            os.replace(path, dir + filename)
+            metrics.count(rows_out=rows, bytes_written=os.path.getsize(dir + filename))
             print("Data saved succesfully!\n")
         else:
             print(
@@ -210,6 +841,238 @@ class Load:
                 "Data was not saved!\n"
             )
 
+    def save_to_dataset(
+        self: pd.DataFrame | duckdb.DuckDBPyRelation | pa.Table | pa.RecordBatchReader,
+        dir: str,
+        basename: str,
+        partition_cols: list[str],
+        *,
+        row_group_size: int = config.Parquet.Row_Group_Size,
+        compression: str = config.Parquet.Compression,
+        dictionary_cols: list[str] | None = None,
+    ) -> list[str]:
+        """save data to a hive partitioned parquet dataset.
+
+        Instance must be a pandas dataframe, duckdb relation, pyarrow table
+          or pyarrow record batch reader. Data is streamed into one file per partition,
+          named after basename, replacing the files previously saved with
+          that basename. Files with other basenames are left as they are.
+
+        Args:
+            dir (str): dataset root directory.
+            basename (str): files basename.
+            partition_cols (list[str]): columns to partition by.
+            row_group_size (int): maximum number of rows per row group.
+            compression (str): parquet compression codec.
+            dictionary_cols (list[str]): columns to dictionary encode.
+              If None, all columns are dictionary encoded.
+
+        Returns:
+            The saved files, relative to dir.
+        """
+        import pyarrow.dataset as ds
+
+        reader = self.get_record_batch_reader().data
+
+        config.check_dir_exists(dir)
+        # Only exact matches, other basenames can share this one as prefix.
+        saved = re.compile(rf"{re.escape(basename)}-\d+\.parquet")
+        for path, _, files in os.walk(dir):
+            for file in files:
+                if saved.fullmatch(file):
+                    os.remove(os.path.join(path, file))
+
+        partitioning = ds.HivePartitioning(
+            pa.schema([reader.schema.field(column) for column in partition_cols]),
+            null_fallback="NULL",
+        )
+        if dictionary_cols is not None:
+            dictionary_cols = [
+                column for column in dictionary_cols if column not in partition_cols
+            ]
+
+        print("Saving to parquet dataset...\n")
+        written: list[ds.WrittenFile] = []
+        ds.write_dataset(
+            reader,
+            dir,
+            format="parquet",
+            partitioning=partitioning,
+            basename_template=basename + "-{i}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            file_options=ds.ParquetFileFormat().make_write_options(
+                compression=compression,
+                use_dictionary=True if dictionary_cols is None else dictionary_cols,
+            ),
+            min_rows_per_group=min(row_group_size, config.Parquet.Batch_Size),
+            max_rows_per_group=row_group_size,
+            file_visitor=written.append,
+        )
+        metrics.count(
+            rows_out=sum(file.metadata.num_rows for file in written),
+            bytes_written=sum(file.size for file in written),
+        )
+        print("Data saved succesfully!\n")
+
+        return [os.path.relpath(file.path, dir) for file in written]
+
+
+@metrics.stage("dedup_partitions")
+def dedup_partitions(
+    stage_dir: str,
+    clean_dir: str,
+    *,
+    keys: list[str] | None = None,
+    fingerprint_bits: int | None = config.Dedup.Fingerprint_Bits,
+    dtypes: list[tuple] | None = None,
+    processes: int = 1,
+    row_group_size: int = config.Parquet.Row_Group_Size,
+    compression: str = config.Parquet.Compression,
+    dictionary_cols: list[str] | None = None,
+) -> int:
+    """Deduplicates the stale partitions of a staged parquet dataset.
+
+    Rows of the same partition have the same partition values, so
+    duplicates can only be found within a partition. Each partition
+    of stage_dir whose files, or the files list, changed after its
+    clean_dir counterpart was written, is deduplicated into a single
+    file in clean_dir. Partitions no longer in stage_dir are removed.
+
+    Deduplication runs in duckdb under the process share of the
+    config.Resources budget, spilling to disk when a partition doesn't
+    fit in memory.
+
+    Args:
+        stage_dir (str): staged dataset root directory.
+        clean_dir (str): clean dataset root directory.
+        keys (list[str]): columns identifying a row. If None, all columns.
+        fingerprint_bits (int): 64 or 128 to compare keys by fingerprint.
+          If None or without keys, rows are compared exactly.
+        dtypes (list[tuple]): column-dtype pairs the clean files are written
+          with, as in Load.cast_dtypes.
+        processes (int): processes sharing the resource budget at the same time.
+        row_group_size (int): maximum number of rows per row group.
+        compression (str): parquet compression codec.
+        dictionary_cols (list[str]): columns to dictionary encode.
+          If None, all columns are dictionary encoded.
+
+    Returns:
+        The number of duplicated rows removed.
+    """
+
+    def partitions(root: str) -> set[str]:
+        return {
+            os.path.relpath(path, root)
+            for path, _, files in os.walk(root)
+            if os.path.normpath(path) != os.path.normpath(root)
+            and any(file.endswith(".parquet") for file in files)
+        }
+
+    set_resources(duckdb.default_connection(), processes)
+    duckdb.default_connection().execute("SET preserve_insertion_order = false;")
+
+    duplicates = 0
+    for partition in sorted(partitions(stage_dir) | partitions(clean_dir)):
+        stage = os.path.join(stage_dir, partition)
+        clean = os.path.join(clean_dir, partition)
+        files = glob.glob(os.path.join(glob.escape(stage), "*.parquet"))
+
+        if not files:
+            shutil.rmtree(clean, ignore_errors=True)
+            if os.path.isdir(stage) and not os.listdir(stage):
+                os.rmdir(stage)
+            continue
+
+        target = os.path.join(clean, "data.parquet")
+        changed = max(os.path.getmtime(path) for path in [stage, *files])
+        if os.path.exists(target) and os.path.getmtime(target) >= changed:
+            continue
+
+        rows = sum(pq.read_metadata(file).num_rows for file in files)
+        metrics.count(
+            rows_in=rows, bytes_read=sum(os.path.getsize(file) for file in files)
+        )
+        data = (
+            Load(duckdb.read_parquet(files, hive_partitioning=False))
+            .purge_duplicates(keys, fingerprint_bits)
+            .cast_dtypes(dtypes or [])
+            .get_record_batch_reader()
+        )
+
+        os.makedirs(clean, exist_ok=True)
+        written = write_record_batches(
+            data.data,
+            target + ".tmp",
+            row_group_size=row_group_size,
+            compression=compression,
+            dictionary_cols=dictionary_cols,
+        )
+        os.replace(target + ".tmp", target)
+        duplicates += rows - written
+
+    print(f"{duplicates} duplicated rows were removed.\n")
+    return duplicates
+
+
+@metrics.stage("write_record_batches")
+def write_record_batches(
+    reader: pa.RecordBatchReader,
+    path: str,
+    *,
+    row_group_size: int = config.Parquet.Row_Group_Size,
+    compression: str = config.Parquet.Compression,
+    dictionary_cols: list[str] | None = None,
+) -> int:
+    """Writes a stream of record batches to a parquet file.
+
+    Batches are buffered until a row group is full, so at most one
+    row group is held in memory at a time. Full row groups are sliced
+    off the buffer and the remainder carries over to the next one, so
+    all row groups but the last have exactly row_group_size rows.
+
+    Args:
+        reader (pa.RecordBatchReader): record batches to write.
+        path (str): parquet file path.
+        row_group_size (int): maximum number of rows per row group.
+        compression (str): parquet compression codec.
+        dictionary_cols (list[str]): columns to dictionary encode.
+          If None, all columns are dictionary encoded.
+
+    Returns:
+        The number of rows written.
+    """
+    rows = 0
+    buffer: list[pa.RecordBatch] = []
+    buffered = 0
+
+    with pq.ParquetWriter(
+        path,
+        reader.schema,
+        compression=compression,
+        use_dictionary=True if dictionary_cols is None else dictionary_cols,
+    ) as writer:
+        for batch in reader:
+            buffer.append(batch)
+            buffered += batch.num_rows
+            if buffered >= row_group_size:
+                table = pa.Table.from_batches(buffer, schema=reader.schema)
+                while buffered >= row_group_size:
+                    writer.write_table(
+                        table.slice(0, row_group_size), row_group_size=row_group_size
+                    )
+                    table = table.slice(row_group_size)
+                    rows += row_group_size
+                    buffered -= row_group_size
+                # Slices are zero-copy, the remainder keeps its batches.
+                buffer = table.to_batches()
+        if buffered:
+            table = pa.Table.from_batches(buffer, schema=reader.schema)
+            writer.write_table(table, row_group_size=row_group_size)
+            rows += buffered
+
+    metrics.count(rows_out=rows, bytes_written=os.path.getsize(path))
+    return rows
+
 
 if __name__ == "__main__":
     pass
@@ -0,0 +1,145 @@
+"""Track ingested raw objects between runs.
+
+This module persists, next to the data, which raw S3 objects were
+already cleaned, so the ingest phase only processes new or changed
+objects and replaces just their parquet files.
+
+Attributes:
+    partition_name: parquet files basename for a raw object key.
+    Manifest: class that loads, compares and saves the manifest of a dataset.
+"""
+
+import os
+import json
+
+
+def partition_name(key: str, prefix: str) -> str:
+    """Parquet files basename for a raw object key.
+
+    The basename is the key relative to the raw prefix, without
+    extension, with "/" encoded as "%2F" (and "%" as "%25"), so objects
+    with the same filename under different subprefixes get different
+    basenames.
+
+    Args:
+        key (str): raw S3 object key.
+        prefix (str): raw S3 prefix of the dataset.
+
+    Returns:
+        The encoded relative key without extension.
+    """
+    if key.startswith(prefix):
+        key = key[len(prefix) :]
+    return os.path.splitext(key)[0].replace("%", "%25").replace("/", "%2F")
+
+
+class Manifest:
+    """Manifest of the raw objects cleaned for a dataset.
+
+    Each entry is keyed by the raw S3 object key and stores its ETag,
+    size, last modification time, the local raw file mtime and the
+    parquet files it was cleaned into.
+
+    Typical example:
+        manifest = Manifest(path)
+        for obj in manifest.changed(objects, local_dir):
+            ...
+            manifest.record(obj, raw_file, files)
+        manifest.save()
+    """
+
+    def __init__(self, path: str):
+        """Class constructor.
+
+        Loads the manifest if it exists, else starts an empty one.
+
+        Args:
+            path (str): manifest json file path.
+        """
+        self.path = path
+        if os.path.exists(path):
+            with open(path) as file:
+                self.entries: dict[str, dict] = json.load(file)
+        else:
+            self.entries = {}
+
+    def changed(self, objects: list[dict], local_dir: str) -> list[dict]:
+        """Returns the objects that are new or changed since the last run.
+
+        An object is changed if its ETag or size differ from the manifest,
+        or if its local raw file or parquet files are missing. Remote
+        raw files, read directly from S3, have no local file to check.
+
+        Args:
+            objects (list[dict]): S3 objects as returned by s3.get_objects.
+            local_dir (str): local directory where the parquet files are.
+
+        Returns:
+            The new or changed S3 objects.
+        """
+        changed = []
+        for obj in objects:
+            entry = self.entries.get(obj["Key"])
+            if (
+                entry is None
+                or entry["etag"] != obj["ETag"]
+                or entry["size"] != obj["Size"]
+                or "files" not in entry
+                or not all(os.path.exists(local_dir + file) for file in entry["files"])
+                or (
+                    entry["mtime"] is not None
+                    and (
+                        not os.path.exists(entry["raw-file"])
+                        or os.path.getmtime(entry["raw-file"]) != entry["mtime"]
+                    )
+                )
+            ):
+                changed.append(obj)
+        return changed
+
+    def removed(self, objects: list[dict]) -> list[str]:
+        """Returns the keys in the manifest that are no longer in S3.
+
+        Args:
+            objects (list[dict]): S3 objects as returned by s3.get_objects.
+        """
+        keys = {obj["Key"] for obj in objects}
+        return [key for key in self.entries if key not in keys]
+
+    def record(self, obj: dict, raw_file: str, files: list[str]):
+        """Records a cleaned object.
+
+        Args:
+            obj (dict): S3 object as returned by s3.get_objects.
+            raw_file (str): local raw file path, or s3:// path if it was
+              read remotely.
+            files (list[str]): parquet files it was cleaned into.
+        """
+        self.entries[obj["Key"]] = {
+            "etag": obj["ETag"],
+            "size": obj["Size"],
+            "last-modified": str(obj["LastModified"]),
+            "raw-file": raw_file,
+            "mtime": None
+            if raw_file.startswith("s3://")
+            else os.path.getmtime(raw_file),
+            "files": files,
+        }
+
+    def forget(self, key: str) -> dict:
+        """Removes an object from the manifest.
+
+        Args:
+            key (str): raw S3 object key.
+
+        Returns:
+            The removed entry.
+        """
+        return self.entries.pop(key)
+
+    def save(self):
+        """Saves the manifest, replacing the previous one atomically."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", "w") as file:
+            json.dump(self.entries, file, indent=2, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
@@ -0,0 +1,300 @@
+"""Profile the stages of the ingest phase.
+
+This module records, for each call of an instrumented function, its
+wall time, CPU time, rows in and out, bytes read and written and the
+peak resident memory of the process, and saves them as a run report
+per dataset.
+
+Stages record in the process they run in. Worker processes return
+their stages with collect, so the parent process can record them
+into the run report of their dataset.
+
+Rows are only counted where it's cheap: lazy duckdb relations aren't
+counted, since that would execute them. Their cost shows up in the
+stage that materializes them, as Load.save_to_dataset.
+
+Attributes:
+    stage: decorator recording a stage each time a function is called.
+    instrument: class decorator recording a stage for each public method.
+    count: adds rows and bytes counters to the running stage.
+    collect: returns and forgets the stages recorded by the process.
+    record: records stages collected by another process.
+    summarize: sums the stages by name.
+    open_metrics: formats a run report as OpenMetrics text.
+    save_report: saves the run report of a dataset, as json and OpenMetrics.
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import functools
+import threading
+import contextvars
+import config
+
+COUNTERS = ["rows-in", "rows-out", "bytes-read", "bytes-written"]
+
+_stages: list[dict] = []
+_lock = threading.Lock()
+_running: contextvars.ContextVar[dict | None] = contextvars.ContextVar(
+    "running", default=None
+)
+
+
+def _peak_rss() -> int:
+    """Peak resident memory of the process, in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports it in kilobytes, macOS in bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _rows(data) -> int | None:
+    """Number of rows of data, if it can be known without computing it.
+
+    Args:
+        data: pyarrow table, pandas dataframe or a Load instance of them.
+    """
+    data = getattr(data, "data", data)
+    if hasattr(data, "num_rows"):
+        return data.num_rows
+    pandas = sys.modules.get("pandas")
+    if pandas is not None and isinstance(data, pandas.DataFrame):
+        return len(data)
+    return None
+
+
+def stage(name: str):
+    """Decorator recording a stage each time a function is called.
+
+    Rows in and out are counted from the first argument and the result,
+    when they're pyarrow tables, pandas dataframes or Load instances of
+    them. Functions can add their own counters with count.
+
+    Args:
+        name (str): stage name.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not config.Metrics.Enabled:
+                return function(*args, **kwargs)
+
+            running = {
+                "name": name,
+                "parent": (_running.get() or {}).get("name"),
+                "rows-in": _rows(args[0]) if args else None,
+            }
+            token = _running.set(running)
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException as e:
+                running["error"] = type(e).__name__
+                raise
+            finally:
+                running["wall"] = time.perf_counter() - wall
+                running["cpu"] = time.process_time() - cpu
+                running["peak-rss"] = _peak_rss()
+                _running.reset(token)
+                with _lock:
+                    _stages.append(running)
+
+            if running.get("rows-out") is None:
+                running["rows-out"] = _rows(result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def instrument(cls):
+    """Class decorator recording a stage for each public method.
+
+    Stages are named after the class and method, as "Load.cast_dtypes".
+
+    Args:
+        cls: class to instrument.
+    """
+    for attribute, value in list(vars(cls).items()):
+        if callable(value) and not attribute.startswith("_"):
+            setattr(cls, attribute, stage(f"{cls.__name__}.{attribute}")(value))
+    return cls
+
+
+def count(**counters: int):
+    """Adds counters to the running stage.
+
+    Counters are the keyword forms of COUNTERS, as rows_out or bytes_read.
+    Outside of a stage, counters are ignored.
+
+    Args:
+        **counters (int): counter values to add.
+    """
+    running = _running.get()
+    if running is None:
+        return
+    for counter, value in counters.items():
+        counter = counter.replace("_", "-")
+        running[counter] = (running.get(counter) or 0) + value
+
+
+def collect() -> list[dict]:
+    """Returns and forgets the stages recorded by the process."""
+    global _stages
+
+    with _lock:
+        stages, _stages = _stages, []
+    return stages
+
+
+def record(stages: list[dict]):
+    """Records stages collected by another process.
+
+    Args:
+        stages (list[dict]): stages returned by collect.
+    """
+    with _lock:
+        _stages.extend(stages)
+
+
+def summarize(stages: list[dict]) -> dict[str, dict]:
+    """Sums the stages by name.
+
+    Args:
+        stages (list[dict]): recorded stages.
+
+    Returns:
+        The calls, wall and CPU time, counters and peak memory of each stage.
+    """
+    summary: dict[str, dict] = {}
+    for entry in stages:
+        total = summary.setdefault(
+            entry["name"],
+            {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak-rss": 0, "errors": 0},
+        )
+        total["calls"] += 1
+        total["wall"] += entry["wall"]
+        total["cpu"] += entry["cpu"]
+        total["peak-rss"] = max(total["peak-rss"], entry["peak-rss"])
+        total["errors"] += "error" in entry
+        for counter in COUNTERS:
+            if entry.get(counter) is not None:
+                total[counter] = total.get(counter, 0) + entry[counter]
+    return summary
+
+
+def open_metrics(report: dict) -> str:
+    """Formats a run report as OpenMetrics text.
+
+    Args:
+        report (dict): run report, as saved by save_report.
+    """
+    families = [
+        ("calls", "calls", "", "Stage calls."),
+        ("wall", "wall", "seconds", "Stage wall time."),
+        ("cpu", "cpu", "seconds", "Stage CPU time."),
+        ("rows-in", "rows_in", "", "Rows the stage received."),
+        ("rows-out", "rows_out", "", "Rows the stage produced."),
+        ("bytes-read", "read", "bytes", "Bytes the stage read."),
+        ("bytes-written", "written", "bytes", "Bytes the stage wrote."),
+        ("peak-rss", "peak_rss", "bytes", "Peak resident memory of the process."),
+    ]
+
+    lines = []
+    for key, name, unit, description in families:
+        metric = f"ingest_stage_{name}" + (f"_{unit}" if unit else "")
+        lines.append(f"# TYPE {metric} gauge")
+        if unit:
+            lines.append(f"# UNIT {metric} {unit}")
+        lines.append(f"# HELP {metric} {description}")
+        for stage_name, total in report["summary"].items():
+            if total.get(key) is not None:
+                labels = (
+                    f'dataset="{report["dataset"]}",phase="{report["phase"]}",'
+                    f'stage="{stage_name}"'
+                )
+                lines.append(f"{metric}{{{labels}}} {total[key]}")
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def save_report(
+    key: str,
+    phase: str,
+    stages: list[dict],
+    elapsed: float,
+    dir: str = config.Metrics.Dir,
+) -> str:
+    """Saves the run report of a dataset.
+
+    The report is saved as <dir>/<key>/<phase>-<timestamp>-<pid>.json,
+    to the microsecond, so back-to-back runs never replace each other's
+    report, and as OpenMetrics text next to it if
+    config.Metrics.Open_Metrics is set.
+    Stages much slower than in the previous report of the same phase
+    are printed as regressions (see config.Metrics).
+
+    Args:
+        key (str): dataset key in config.datasets.
+        phase (str): ingest phase the stages ran in, "clean" or "load".
+        stages (list[dict]): recorded stages.
+        elapsed (float): wall time of the whole run in seconds.
+        dir (str): run reports directory.
+
+    Returns:
+        The json report path.
+    """
+    dir = os.path.join(dir, key)
+    os.makedirs(dir, exist_ok=True)
+    previous = sorted(
+        file
+        for file in os.listdir(dir)
+        if file.startswith(phase + "-") and file.endswith(".json")
+    )
+
+    now = time.time()
+    report = {
+        "dataset": key,
+        "phase": phase,
+        "created-at": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(now)),
+        "elapsed": elapsed,
+        "summary": summarize(stages),
+        "stages": stages,
+    }
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(now))
+    path = os.path.join(
+        dir, f"{phase}-{stamp}.{int(now % 1 * 1e6):06d}-{os.getpid()}.json"
+    )
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+    if config.Metrics.Open_Metrics:
+        with open(os.path.splitext(path)[0] + ".prom", "w") as file:
+            file.write(open_metrics(report))
+
+    print(f"{key}: {phase} stages by wall time:")
+    for name, total in sorted(
+        report["summary"].items(), key=lambda item: item[1]["wall"], reverse=True
+    )[:5]:
+        print(f"  {name}: {total['wall']:.2f}s wall, {total['cpu']:.2f}s cpu")
+    print()
+
+    if previous:
+        with open(os.path.join(dir, previous[-1])) as file:
+            before = json.load(file)["summary"]
+        for name, total in report["summary"].items():
+            if (
+                name in before
+                and total["wall"] >= config.Metrics.Regression_Min
+                and total["wall"]
+                > before[name]["wall"] * config.Metrics.Regression_Factor
+            ):
+                print(
+                    f"{key}: {name} took {total['wall']:.2f}s, "
+                    f"{before[name]['wall']:.2f}s in the previous run.\n"
+                )
+
+    return path
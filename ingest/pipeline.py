@@ -5,83 +5,326 @@ in order to prepare the data for transformation.
 """
 
 import os
+import time
+import argparse
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import duckdb
 import config
 import s3
-from load import unify_csv, Load
+import metrics
+from load import unify_csv, save_rejects, dedup_partitions, set_resources, Load
+from manifest import Manifest, partition_name
 
 BUCKET = config.S3.Bucket
 
 
-def main(arg: str):
+def clean(data: Load, dataset: dict) -> Load:
+    """Chains the cleaning steps of a dataset.
+
+    Args:
+        data (Load): data to clean.
+        dataset (dict): dataset configuration values from config.datasets.
+
+    Returns:
+        The cleaned Load instance, ready to be saved.
+    """
+    commoditie_format = dataset["commoditie-col-format"]
+    # Monetary columns typed by the csv schema were already parsed as numbers.
+    monetary_cols = [
+        column
+        for column in dataset["monetary-cols"]
+        if column not in dataset["csv-schema"]["types"]
+    ]
+
+    if config.Execution.Mode == "sql":
+        data = data.purge_columns(columns=dataset["drop-cols"])
+    elif config.Execution.Mode == "arrow":
+        data = data.get_pyarrow_table().purge_columns(  # type: ignore
+            columns=dataset["drop-cols"]
+        )
+    else:
+        data = (
+            data.get_pyarrow_table()  # type: ignore
+            .purge_columns(columns=dataset["drop-cols"])
+            .table_to_dataframe()
+        )
+
+    return (
+        data.fix_monetary_punctuation(monetary_cols)
+        .format_commoditie_code(
+            commoditie_col=commoditie_format["commoditie-col"],
+            pad_=commoditie_format["pad"],
+            slice_=commoditie_format["slice"],
+            width=commoditie_format["width"],
+            side=commoditie_format["side"],
+            fillchar=commoditie_format["fillchar"],
+            stop=commoditie_format["stop"],
+        )
+        .cast_dtypes(dtypes=dataset["dtypes"])
+    )
+
+
+def clean_dataset(key: str, datasets: int = 1):
+    """Extracts, cleans and saves a dataset.
+
+    Only raw objects that changed since the last run are processed.
+    Each raw file is cleaned independently, in parallel, into a hive
+    partitioned staged dataset. Then the partitions it changed are
+    deduplicated into the clean dataset.
+
+    The resource budget (see config.Resources) is shared by the datasets
+    cleaned at the same time, and the dataset share by its file workers.
+
+    The stages of the run, including the ones run by worker processes,
+    are saved as a run report of the dataset, even if it fails.
+
+    Args:
+        key (str): dataset key in config.datasets.
+        datasets (int): datasets cleaned at the same time.
+    """
+    start = time.perf_counter()
+    try:
+        _clean_dataset(key, datasets)
+    finally:
+        metrics.save_report(
+            key, "clean", metrics.collect(), time.perf_counter() - start
+        )
+
+
+def _clean_dataset(key: str, datasets: int):
+    """Runs clean_dataset without saving its run report."""
+    dataset = config.datasets[key]
+    manifest = Manifest(dataset["manifest"])
+
+    objects = s3.get_objects(
+        bucket=BUCKET,
+        prefix=dataset["s3-raw"],
+        start_after=dataset["s3-raw"],
+        suffix=".csv",
+    )
+    changed = manifest.changed(objects, dataset["local-stage"])
+
+    print(f"{key}: {len(changed)} of {len(objects)} raw objects changed.\n")
+
+    if not config.Execution.Remote_Read:
+        s3.download_object(
+            bucket=BUCKET,
+            prefix=dataset["s3-raw"],
+            start_after=dataset["s3-raw"],
+            objects=changed,
+        )
+
+    raw_files = {
+        obj["Key"]: f"s3://{BUCKET}/{obj['Key']}"
+        if config.Execution.Remote_Read
+        else os.path.join(config.Local_Dir.Data, obj["Key"])
+        for obj in changed
+    }
+
+    errors = []
+    jobs = min(config.Execution.File_Jobs, len(changed))
+    processes = datasets * max(1, jobs)
+
+    def record(obj: dict, result: tuple[list[str], list[dict]]):
+        files, stages = result
+        metrics.record(stages)
+        previous = manifest.entries.get(obj["Key"], {}).get("files", [])
+        manifest.record(obj, raw_files[obj["Key"]], files)
+        manifest.save()
+        # Files named after an earlier basename of the object are stale.
+        for file in set(previous) - set(files):
+            if os.path.exists(dataset["local-stage"] + file):
+                os.remove(dataset["local-stage"] + file)
+
+    if jobs <= 1:
+        for obj in changed:
+            try:
+                record(
+                    obj,
+                    clean_file(
+                        key,
+                        raw_files[obj["Key"]],
+                        partition_name(obj["Key"], dataset["s3-raw"]),
+                        processes,
+                    ),
+                )
+            except Exception as e:
+                e.add_note(f"Raw object: {obj['Key']}")
+                errors.append(e)
+    else:
+        with ProcessPoolExecutor(
+            max_workers=jobs, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            futures = {
+                pool.submit(
+                    clean_file,
+                    key,
+                    raw_files[obj["Key"]],
+                    partition_name(obj["Key"], dataset["s3-raw"]),
+                    processes,
+                ): obj
+                for obj in changed
+            }
+            for future in as_completed(futures):
+                try:
+                    record(futures[future], future.result())
+                except Exception as e:
+                    e.add_note(f"Raw object: {futures[future]['Key']}")
+                    errors.append(e)
+
+    for removed in manifest.removed(objects):
+        entry = manifest.forget(removed)
+        for path in (
+            entry["raw-file"],
+            dataset["local-rejects"]
+            + partition_name(removed, dataset["s3-raw"])
+            + ".parquet",
+            *(dataset["local-stage"] + file for file in entry.get("files", [])),
+        ):
+            if os.path.exists(path):
+                os.remove(path)
+        print(f"{removed} no longer exists, its files were removed.\n")
+    manifest.save()
+
+    # Partitions changed by the files that did succeed are deduplicated anyway.
+    dedup_partitions(
+        dataset["local-stage"],
+        dataset["local-clean"],
+        keys=dataset["dedup-keys"],
+        dtypes=dataset["dtypes"],
+        dictionary_cols=dataset["dictionary-cols"],
+        processes=datasets,
+    )
+
+    if errors:
+        raise ExceptionGroup(
+            f"{len(errors)} of {len(changed)} raw objects of {key} failed", errors
+        )
+
+
+def clean_file(
+    key: str, raw_file: str, basename: str, processes: int
+) -> tuple[list[str], list[dict]]:
+    """Cleans a raw file into the staged dataset of its dataset.
+
+    Args:
+        key (str): dataset key in config.datasets.
+        raw_file (str): local raw file path, or s3:// path.
+        basename (str): staged files basename, from manifest.partition_name.
+        processes (int): processes sharing the resource budget at the same time.
+
+    Returns:
+        The staged parquet files, relative to the stage directory, and the
+        stages recorded by the process, to be recorded by the caller.
+    """
+    dataset = config.datasets[key]
+
+    set_resources(duckdb.default_connection(), processes)
+
+    data = clean(
+        Load(unify_csv([raw_file], schema=dataset["csv-schema"])),
+        dataset,
+    )
+
+    data.show_info()
+    files = data.save_to_dataset(
+        dir=dataset["local-stage"],
+        basename=basename,
+        partition_cols=dataset["partition-cols"],
+        dictionary_cols=dataset["dictionary-cols"],
+    )
+    save_rejects(dir=dataset["local-rejects"], filename=basename + ".parquet")
+
+    return files, metrics.collect()
+
+
+def run_dataset(key: str, datasets: int = 1) -> tuple[float, str | None]:
+    """Runs clean_dataset, isolating its errors.
+
+    Errors are returned instead of raised, so a failing dataset doesn't
+    abort the others.
+
+    Args:
+        key (str): dataset key in config.datasets.
+        datasets (int): datasets cleaned at the same time.
+
+    Returns:
+        The wall time in seconds and the error traceback, if any.
+    """
+    start = time.perf_counter()
+    try:
+        clean_dataset(key, datasets)
+    except Exception:
+        return time.perf_counter() - start, traceback.format_exc()
+    return time.perf_counter() - start, None
+
+
+def clean_datasets(keys: list[str], jobs: int) -> dict[str, tuple[float, str | None]]:
+    """Cleans datasets concurrently.
+
+    Each dataset runs in its own process, since cleaning is CPU-bound,
+    while its S3 transfers run on threads within that process. Processes
+    are spawned instead of forked, as duckdb and boto3 aren't fork-safe.
+
+    Args:
+        keys (list[str]): dataset keys in config.datasets.
+        jobs (int): maximum number of datasets cleaned at the same time.
+
+    Returns:
+        The wall time and error traceback of each dataset.
+    """
+    if jobs <= 1 or len(keys) <= 1:
+        return {key: run_dataset(key) for key in keys}
+
+    datasets = min(jobs, len(keys))
+    with ProcessPoolExecutor(
+        max_workers=datasets,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as pool:
+        futures = {key: pool.submit(run_dataset, key, datasets) for key in keys}
+        return {key: future.result() for key, future in futures.items()}
+
+
+def main(arg: str, jobs: int = config.Execution.Jobs):
     # Extract
     if arg == "clean" or arg == "all":
-        try:
-            for key in config.datasets.keys():
-                s3.download_object(
-                    bucket=BUCKET,
-                    prefix=config.datasets[key]["s3-raw"],
-                    start_after=config.datasets[key]["s3-raw"],
-                )
+        results = clean_datasets(list(config.datasets.keys()), jobs)
 
-                data = unify_csv(config.datasets[key]["local-raw"])
-
-                data = Load(data)
-
-                data = (
-                    data.get_pyarrow_table()  # type: ignore
-                    .purge_columns(columns=config.datasets[key]["drop-cols"])
-                    .table_to_dataframe()
-                    .fix_monetary_punctuation(config.datasets[key]["monetary-cols"])
-                    .format_commoditie_code(
-                        commoditie_col=config.datasets[key]["commoditie-col-format"][
-                            "commoditie-col"
-                        ],
-                        pad_=config.datasets[key]["commoditie-col-format"]["pad"],
-                        slice_=config.datasets[key]["commoditie-col-format"]["slice"],
-                        width=config.datasets[key]["commoditie-col-format"]["width"],
-                        side=config.datasets[key]["commoditie-col-format"]["side"],
-                        fillchar=config.datasets[key]["commoditie-col-format"][
-                            "fillchar"
-                        ],
-                        stop=config.datasets[key]["commoditie-col-format"]["stop"],
-                    )
-                    .cast_dtypes(dtypes=config.datasets[key]["dtypes"])
-                    .purge_duplicates()
-                )
+        print("Cleaning summary:")
+        for key, (elapsed, error) in results.items():
+            print(f"  {key}: {'failed' if error else 'ok'} in {elapsed:.2f}s")
+        print()
 
-                data.show_info()
-                data.save_to_parquet(
-                    dir=config.datasets[key]["local-clean"],
-                    filename=config.datasets[key]["filename-clean"],
-                )
-        except Exception as e:
+        failed = [key for key, (_, error) in results.items() if error]
+        if failed:
+            for key in failed:
+                print(f"{key} traceback:\n{results[key][1]}")
             print(
-                f"There was an error in the cleaning phase: {e}\n"
+                f"There was an error in the cleaning phase: {', '.join(failed)} failed\n"
                 "This error in non-recoverable!\n"
             )
-            raise
+            raise RuntimeError(f"Cleaning failed for {', '.join(failed)}")
 
     # load
     if arg == "load" or arg == "all":
         try:
             for key in config.datasets.keys():
-                local_dir = config.datasets[key]["local-clean"]
-                s3_dir = config.datasets[key]["s3-clean"]
-
-                if not s3.get_objects(
-                    bucket=BUCKET, prefix=s3_dir, start_after=s3_dir
-                ) and os.listdir(local_dir):
-                    for filename in os.listdir(local_dir):
-                        s3.upload_object(
-                            bucket=BUCKET,
-                            filename=local_dir + filename,
-                            object_name=f"{s3_dir}{filename}",
-                        )
-
-                else:
-                    print(
-                        f"{local_dir} is empty or {s3_dir} has data\n"
-                        "Nothing was uploaded!\n"
+                start = time.perf_counter()
+                # Partitions rewritten or removed by dedup_partitions are
+                # synced, the rest are left as they are in S3.
+                if not s3.sync_objects(
+                    config.datasets[key]["local-clean"],
+                    BUCKET,
+                    config.datasets[key]["s3-clean"],
+                ):
+                    raise RuntimeError(f"{key} clean data was not fully synced to S3")
+
+                stages = metrics.collect()
+                if stages:
+                    metrics.save_report(
+                        key, "load", stages, time.perf_counter() - start
                     )
 
         except Exception as e:
@@ -93,4 +336,15 @@ def main(arg: str):
 
 
 if __name__ == "__main__":
-    main(arg="all")
+    parser = argparse.ArgumentParser(description="Runs the ingest phase.")
+    parser.add_argument(
+        "arg", nargs="?", default="all", choices=["clean", "load", "all"]
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=config.Execution.Jobs,
+        help="maximum number of datasets cleaned at the same time.",
+    )
+    args = parser.parse_args()
+    main(arg=args.arg, jobs=args.jobs)
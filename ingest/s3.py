@@ -4,62 +4,183 @@ This modules stores functions to make CRUD operations
 on a S3 Bucket. For the S3 API to work, it is needed a
 ~/.config/aws directory with credentials on the local machine.
 
+Transfers run in parallel on a thread pool sharing one client,
+and large files are split in multipart transfers.
+
 Attributes:
-    get_s3_client: creates a s3 client instance.
+    get_s3_client: returns the shared s3 client instance.
+    get_transfer_config: returns the multipart transfer configuration.
+    iter_objects: lazily yields all objects in the given s3 path.
     get_objects: returns a list of objects in the given s3 path.
     download_raw_data: downloads data from a given raw s3 path
       to a default raw local path.
     upload_clean_data: uploads data to a given s3 path,
       from a given local path.
+    upload_objects: uploads several files in parallel.
+    delete_objects: deletes several objects.
+    sync_objects: mirrors a local directory to an s3 path.
+    register_duckdb_secret: shares the boto3 credentials with duckdb httpfs.
+
+Listings and transfers are recorded as stages (see metrics.stage).
+
+boto3 is only imported when the first s3 call is made, so phases
+working on local data don't pay for it.
 """
 
+from __future__ import annotations
+
 import os
+import time
+import typing
 import logging
+import threading
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 import config
-import boto3
-from botocore.exceptions import ClientError
+import metrics
+
+if typing.TYPE_CHECKING:
+    import duckdb
+    from boto3.s3.transfer import TransferConfig
+
+_client = None
+_client_lock = threading.Lock()
 
 
 def get_s3_client():
-    """Creates a s3 client instance.
+    """Returns the shared s3 client instance.
+
+    The client is created once. boto3 clients are thread-safe, so
+    every transfer worker shares it and its connection pool.
 
     Returns:
         boto3.Client
     """
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            import boto3
+            from botocore.config import Config
+
+            _client = boto3.client(
+                "s3",
+                endpoint_url=config.S3.Endpoint_Url,
+                config=Config(
+                    max_pool_connections=config.S3.Max_Pool_Connections,
+                    retries={"mode": "adaptive"},
+                ),
+            )
+    return _client
 
-    s3 = boto3.client("s3")
-    return s3
 
+def get_transfer_config() -> TransferConfig:
+    """Returns the multipart transfer configuration.
 
-def get_objects(bucket: str, prefix: str, start_after: str) -> list:
+    Returns:
+        boto3.s3.transfer.TransferConfig
+    """
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(
+        multipart_threshold=config.S3.Multipart_Threshold,
+        multipart_chunksize=config.S3.Multipart_Chunksize,
+        max_concurrency=config.S3.Max_Concurrency,
+    )
+
+
+def _report(action: str, count: int, size: int, elapsed: float):
+    """Prints the throughput of a transfer run."""
+    mb = size / 1024**2
+    print(
+        f"{action} {count} objects, {mb:.1f} MB in {elapsed:.2f}s "
+        f"({mb / elapsed if elapsed else 0:.1f} MB/s).\n"
+    )
+
+
+def iter_objects(
+    bucket: str,
+    prefix: str,
+    start_after: str,
+    *,
+    suffix: str | None = None,
+    min_size: int | None = None,
+    max_size: int | None = None,
+) -> Iterator[dict]:
+    """Lazily yields all objects in a given s3 path.
+
+    Listing follows continuation tokens, so there's no limit on the number
+    of objects, and each page is only requested once the previous one
+    was consumed.
+
+    Args:
+        bucket (str): target s3 bucket.
+        prefix (str): s3 objects common prefix.
+        start_after (str): from where to start reading.
+        suffix (str): only yield objects whose key ends with it.
+        min_size (int): only yield objects of at least this size in bytes.
+        max_size (int): only yield objects of at most this size in bytes.
+
+    Yields:
+        S3 objects in the given prefix.
+    """
+    s3 = get_s3_client()
+    paginator = s3.get_paginator("list_objects_v2")
+    pages = paginator.paginate(Bucket=bucket, Prefix=prefix, StartAfter=start_after)
+    for page in pages:
+        for obj in page.get("Contents", []):
+            if suffix is not None and not obj["Key"].endswith(suffix):
+                continue
+            if min_size is not None and obj["Size"] < min_size:
+                continue
+            if max_size is not None and obj["Size"] > max_size:
+                continue
+            yield obj
+
+
+@metrics.stage("s3.get_objects")
+def get_objects(bucket: str, prefix: str, start_after: str, **filters) -> list:
     """Shows all objects in a given s3 path.
 
     Args:
         bucket (str): target s3 bucket.
         prefix (str): s3 objects common prefix.
         start_after (str): from where to start reading.
+        **filters: suffix, min_size and max_size filters of iter_objects.
 
         Returns:
             A list of S3 objects if there are any in the given prefix,
               else returns a empty list.
     """
-    s3 = get_s3_client()
-    response = s3.list_objects_v2(Bucket=bucket, Prefix=prefix, StartAfter=start_after)
-    if response["KeyCount"] > 0:
-        return response["Contents"]
-    else:
-        return []
+    return list(iter_objects(bucket, prefix, start_after, **filters))
 
 
-def download_object(bucket: str, prefix: str, start_after: str, verbose: bool = False):
+@metrics.stage("s3.download_object")
+def download_object(
+    bucket: str,
+    prefix: str,
+    start_after: str,
+    verbose: bool = False,
+    objects: Iterable[dict] | None = None,
+):
     """Downloads S3 objects from a given S3 path.
 
+    If objects are given, exactly those objects are downloaded, replacing
+    their local copies. Else everything under the path is downloaded,
+    only if the local directory is empty.
+
+    Objects are submitted for download as soon as they are listed, so
+    transfers start while later pages are still being listed.
+
     Args:
         bucket (str): target s3 bucket.
         prefix (str): s3 objects common prefix.
         start_after (str): from where to start reading.
         verbose (bool): whether to print or not each found object.
           default is False.
+        objects (Iterable[dict]): S3 objects, as yielded by iter_objects,
+          to download. default is None.
 
     Returns:
         bool: True if data was downloaded, else False.
@@ -67,23 +188,45 @@ def download_object(bucket: str, prefix: str, start_after: str, verbose: bool =
 
     config.check_dir_exists(f"{config.Local_Dir.Data}/{start_after}")
 
-    if not os.listdir(f"{config.Local_Dir.Data}/{start_after}"):
-        s3 = get_s3_client()
-        response = get_objects(bucket, prefix, start_after)
+    if objects is None and os.listdir(f"{config.Local_Dir.Data}/{start_after}"):
+        return False
 
-        if verbose:
-            for obj in response:
-                print(obj["Key"])
+    s3 = get_s3_client()
+    transfer_config = get_transfer_config()
+    if objects is None:
+        objects = iter_objects(bucket, prefix, start_after)
 
-        for obj in response:
-            s3.download_file(
-                bucket, f"{obj['Key']}", f"{config.Local_Dir.Data}/{obj['Key']}"
+    count = 0
+    size = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=config.S3.Max_Workers) as pool:
+        futures = []
+        for obj in objects:
+            if verbose:
+                print(obj["Key"])
+            futures.append(
+                pool.submit(
+                    s3.download_file,
+                    bucket,
+                    f"{obj['Key']}",
+                    f"{config.Local_Dir.Data}/{obj['Key']}",
+                    Config=transfer_config,
+                )
             )
+            count += 1
+            size += obj["Size"]
+        for future in futures:
+            future.result()
 
-        return True
-    return False
+    if not count:
+        return False
+
+    _report("Downloaded", count, size, time.perf_counter() - start)
+    metrics.count(bytes_read=size)
+    return True
 
 
+@metrics.stage("s3.upload_object")
 def upload_object(filename: str, bucket: str, object_name: str):
     """Upload a file to an S3 given path.
 
@@ -95,13 +238,201 @@ def upload_object(filename: str, bucket: str, object_name: str):
     Returns:
         True if data was uploaded, else False.
     """
+    from boto3.exceptions import S3UploadFailedError
+    from botocore.exceptions import ClientError
 
-    s3 = boto3.client("s3")
+    s3 = get_s3_client()
     print("Uploading data...\n")
     try:
-        s3.upload_file(filename, bucket, object_name)
-    except ClientError as e:
-        logging.error(e)
+        start = time.perf_counter()
+        s3.upload_file(filename, bucket, object_name, Config=get_transfer_config())
+    except (ClientError, S3UploadFailedError) as e:
+        logging.error(f"{filename} was not uploaded: {e}")
+        return False
+    print("Data uploaded successfully!\n")
+    _report("Uploaded", 1, os.path.getsize(filename), time.perf_counter() - start)
+    metrics.count(bytes_written=os.path.getsize(filename))
+    return True
+
+
+@metrics.stage("s3.upload_objects")
+def upload_objects(files: list[tuple[str, str]], bucket: str) -> bool:
+    """Upload several files to S3 in parallel.
+
+    A failed upload doesn't stop the others, every failure is logged.
+
+    Args:
+        files (list[tuple[str, str]]): local file path and target S3 object
+          path pairs to upload.
+        bucket (str): target S3 bucket to upload.
+
+    Returns:
+        True if all data was uploaded, else False.
+    """
+    from boto3.exceptions import S3UploadFailedError
+    from botocore.exceptions import ClientError
+
+    s3 = get_s3_client()
+    transfer_config = get_transfer_config()
+    print("Uploading data...\n")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=config.S3.Max_Workers) as pool:
+        futures = [
+            pool.submit(
+                s3.upload_file, filename, bucket, object_name, Config=transfer_config
+            )
+            for filename, object_name in files
+        ]
+        uploaded, failed = [], []
+        for future, (filename, object_name) in zip(futures, files):
+            try:
+                future.result()
+            except (ClientError, S3UploadFailedError) as e:
+                logging.error(f"{filename} was not uploaded to {object_name}: {e}")
+                failed.append(filename)
+            else:
+                uploaded.append(filename)
+    size = sum(os.path.getsize(filename) for filename in uploaded)
+    _report("Uploaded", len(uploaded), size, time.perf_counter() - start)
+    metrics.count(bytes_written=size)
+
+    if failed:
+        print(f"{len(failed)} of {len(files)} files were not uploaded.\n")
         return False
     print("Data uploaded successfully!\n")
     return True
+
+
+@metrics.stage("s3.delete_objects")
+def delete_objects(keys: list[str], bucket: str) -> bool:
+    """Deletes several S3 objects, up to 1000 per request.
+
+    Args:
+        keys (list[str]): S3 object paths to delete.
+        bucket (str): target S3 bucket.
+
+    Returns:
+        True if all objects were deleted, else False.
+    """
+    from botocore.exceptions import ClientError
+
+    s3 = get_s3_client()
+    deleted = True
+    for start in range(0, len(keys), 1000):
+        try:
+            response = s3.delete_objects(
+                Bucket=bucket,
+                Delete={
+                    "Objects": [{"Key": key} for key in keys[start : start + 1000]],
+                    "Quiet": True,
+                },
+            )
+        except ClientError as e:
+            logging.error(e)
+            deleted = False
+            continue
+        for error in response.get("Errors", []):
+            logging.error(f"{error['Key']} was not deleted: {error['Message']}")
+            deleted = False
+    return deleted
+
+
+def sync_objects(local_dir: str, bucket: str, prefix: str) -> bool:
+    """Mirrors a local directory to an S3 path.
+
+    Files missing in S3, of another size, or modified after their S3
+    object are uploaded, and objects with no local file are deleted, so
+    only what changed since the last sync is transferred. An empty or
+    missing local directory isn't synced, so it can't wipe the S3 path.
+
+    S3 modification times are whole seconds, so local ones are truncated
+    to whole seconds too. Else a file uploaded within the second it was
+    written would look newer than its object, and be uploaded again.
+
+    Args:
+        local_dir (str): local directory to mirror.
+        bucket (str): target S3 bucket.
+        prefix (str): target S3 path, ending in "/".
+
+    Returns:
+        True if all changes were synced, else False.
+    """
+    local = {
+        prefix + os.path.relpath(os.path.join(path, filename), local_dir): os.path.join(
+            path, filename
+        )
+        for path, _, filenames in os.walk(local_dir)
+        for filename in filenames
+    }
+    if not local:
+        print(f"{local_dir} is empty, nothing was synced!\n")
+        return True
+    objects = {obj["Key"]: obj for obj in iter_objects(bucket, prefix, prefix)}
+
+    uploads = [
+        (filename, key)
+        for key, filename in sorted(local.items())
+        if key not in objects
+        or objects[key]["Size"] != os.path.getsize(filename)
+        or objects[key]["LastModified"].timestamp() < int(os.path.getmtime(filename))
+    ]
+    deletes = sorted(key for key in objects if key not in local)
+
+    synced = True
+    if uploads:
+        synced = upload_objects(uploads, bucket)
+    if deletes:
+        synced = delete_objects(deletes, bucket) and synced
+        print(f"Deleted {len(deletes)} objects no longer in {local_dir}.\n")
+    if not uploads and not deletes:
+        print(f"{prefix} is up to date with {local_dir}.\n")
+    return synced
+
+
+def register_duckdb_secret(connection: duckdb.DuckDBPyConnection):
+    """Shares the boto3 credentials with duckdb httpfs.
+
+    Creates a duckdb s3 secret from the same credentials, region and
+    endpoint the boto3 client uses, so duckdb can scan s3:// paths.
+
+    Args:
+        connection (DuckDBPyConnection): duckdb connection to configure.
+
+    Raises:
+        ValueError: if boto3 finds no credentials.
+    """
+    import boto3
+
+    session = boto3.Session()
+    credentials = session.get_credentials()
+    if credentials is None:
+        raise ValueError(
+            "No AWS credentials found for duckdb to read s3:// paths: set "
+            "AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY, or ~/.aws/credentials"
+        )
+    credentials = credentials.get_frozen_credentials()
+
+    options = {
+        "KEY_ID": credentials.access_key,
+        "SECRET": credentials.secret_key,
+        "REGION": session.region_name or "us-east-1",
+    }
+    if credentials.token:
+        options["SESSION_TOKEN"] = credentials.token
+    if config.S3.Endpoint_Url:
+        endpoint = urlparse(config.S3.Endpoint_Url)
+        options["ENDPOINT"] = endpoint.netloc
+        options["USE_SSL"] = str(endpoint.scheme == "https").lower()
+        options["URL_STYLE"] = "path"
+
+    connection.execute("INSTALL httpfs; LOAD httpfs;")
+    connection.execute(
+        "CREATE OR REPLACE SECRET boto3_s3 (TYPE s3, "
+        + ", ".join(
+            f"{option} "
+            + (value if option == "USE_SSL" else "'" + value.replace("'", "''") + "'")
+            for option, value in options.items()
+        )
+        + ")"
+    )
@@ -0,0 +1,34 @@
+import sys
+import uuid
+import pytest
+
+sys.path.append("./ingest/")
+import config  # type: ignore
+import s3  # type: ignore
+
+
+@pytest.fixture(scope="session")
+def s3_endpoint():
+    """Endpoint of a local S3 stand-in, shared by the whole session."""
+    server = pytest.importorskip("moto.server").ThreadedMotoServer(
+        port=0, verbose=False
+    )
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f"http://{host}:{port}"
+    server.stop()
+
+
+@pytest.fixture
+def bucket(s3_endpoint, tmp_path, monkeypatch):
+    """A new bucket of the local S3 stand-in, local data goes to tmp_path."""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(config.S3, "Endpoint_Url", s3_endpoint)
+    monkeypatch.setattr(config.Local_Dir, "Data", str(tmp_path) + "/")
+    monkeypatch.setattr(s3, "_client", None)
+
+    name = f"bucket-{uuid.uuid4().hex[:12]}"
+    s3.get_s3_client().create_bucket(Bucket=name)
+    return name
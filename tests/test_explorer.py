@@ -0,0 +1,63 @@
+import sys
+import duckdb
+import pytest
+
+sys.path.append("./ingest/")
+sys.path.append("./visualize/")
+import config  # type: ignore
+from database import connect  # type: ignore
+from explorer import run_query  # type: ignore
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.Dashboard, "Temp_Dir", str(tmp_path / "tmp"))
+    monkeypatch.setattr(config.Transform, "Source_Views", False)
+    path = str(tmp_path / "db.duckdb")
+    with duckdb.connect(path) as connection:
+        connection.execute("CREATE TABLE t AS SELECT range id FROM range(10)")
+    (tmp_path / "secret.csv").write_text("key,value\naws_secret,abc\n")
+    return path
+
+
+def test_select_runs(database):
+    data, stats = run_query("SELECT * FROM t", database=database)
+
+    assert data["id"].tolist() == list(range(10))
+    assert not stats["has-next"]
+
+
+@pytest.mark.parametrize("function", ["read_text", "read_csv"])
+def test_outside_files_are_rejected(database, tmp_path, function):
+    with pytest.raises(duckdb.PermissionException):
+        run_query(
+            f"SELECT * FROM {function}('{tmp_path / 'secret.csv'}')", database=database
+        )
+
+
+def test_urls_are_rejected(database):
+    with pytest.raises(duckdb.PermissionException):
+        run_query("SELECT * FROM read_csv('http://localhost/x.csv')", database=database)
+
+
+def test_sandbox_is_locked(database):
+    with connect(database) as connection:
+        with pytest.raises(duckdb.InvalidInputException):
+            connection.execute("SET enable_external_access = true")
+
+
+def test_source_views_read_only_clean_dirs(database, tmp_path, monkeypatch):
+    clean = tmp_path / "exports" / "clean"
+    clean.mkdir(parents=True)
+    duckdb.sql("SELECT 1 id").write_parquet(str(clean / "data.parquet"))
+    monkeypatch.setattr(config.Transform, "Source_Views", True)
+    monkeypatch.setitem(config.Local_Dir.Exports, "clean", str(clean) + "/")
+
+    data, _ = run_query(
+        f"SELECT * FROM read_parquet('{clean}/*.parquet')", database=database
+    )
+    assert data["id"].tolist() == [1]
+    with pytest.raises(duckdb.PermissionException):
+        run_query(
+            f"SELECT * FROM read_text('{tmp_path / 'secret.csv'}')", database=database
+        )
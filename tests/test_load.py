@@ -0,0 +1,167 @@
+import os
+import sys
+from decimal import Decimal
+import duckdb
+import pytest
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.append("./ingest/")
+import config  # type: ignore
+from load import Load, unify_csv, save_rejects, write_record_batches, dedup_partitions  # type: ignore
+
+
+def test_dane_monetary_values(tmp_path):
+    raw = tmp_path / "raw.csv"
+    raw.write_text(
+        "COD_PAI4;POSAR;DPTO1;FOBPES;AGRENA\n"
+        "249;901380000;76;1.234,56;12,50\n"
+        "589;0901119000;76;45.678.901,23;1.000,00\n"
+        "169;6109100000;76;987,00;0,75\n"
+        "249;901380000;76;-3.000,10;0,00\n"
+        "589;0901119000;76;n/d;1,00\n"
+    )
+
+    data = unify_csv([str(raw)], schema=config.Exports.Csv_Schema)
+
+    assert data.select("FOBPES, AGRENA").fetchall() == [
+        (Decimal("1234.56"), Decimal("12.50")),
+        (Decimal("45678901.23"), Decimal("1000.00")),
+        (Decimal("987.00"), Decimal("0.75")),
+        (Decimal("-3000.10"), Decimal("0.00")),
+    ]
+    assert save_rejects(str(tmp_path) + "/rejects/", "raw.parquet") == 1
+
+
+def test_row_groups_are_full(tmp_path):
+    table = pa.table({"id": pa.array(range(3 * 1_000 + 123))})
+    reader = pa.RecordBatchReader.from_batches(
+        table.schema, table.to_batches(max_chunksize=700)
+    )
+    path = str(tmp_path / "data.parquet")
+
+    assert write_record_batches(reader, path, row_group_size=1_000) == table.num_rows
+
+    metadata = pq.ParquetFile(path).metadata
+    assert [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)] == [
+        1_000,
+        1_000,
+        1_000,
+        123,
+    ]
+    assert pq.read_table(path).equals(table)
+
+
+def test_basenames_sharing_a_prefix_are_kept(tmp_path):
+    dir = str(tmp_path) + "/"
+
+    def save(basename: str, rows: int) -> list[str]:
+        table = pa.table({"DPTO1": [76] * rows, "id": list(range(rows))})
+        return Load(table).save_to_dataset(dir, basename, ["DPTO1"])
+
+    x = save("x", 1)
+    x_1 = save("x-1", 2)
+    assert sorted(x + x_1) == ["DPTO1=76/x-0.parquet", "DPTO1=76/x-1-0.parquet"]
+
+    def rows(files: list[str]) -> int:
+        return pq.read_table(dir + files[0]).num_rows
+
+    save("x", 3)
+    assert (rows(x), rows(x_1)) == (3, 2)
+    save("x-1", 4)
+    assert (rows(x), rows(x_1)) == (3, 4)
+
+
+def stage_file(dir: str, partition: str, name: str, ids: list[int]):
+    os.makedirs(dir + partition, exist_ok=True)
+    pq.write_table(
+        pa.table({"id": ids, "value": [f"v{i}" for i in ids]}),
+        f"{dir}{partition}/{name}",
+    )
+
+
+def test_partitions_are_deduplicated_across_files(tmp_path):
+    stage, clean = f"{tmp_path}/stage/", f"{tmp_path}/clean/"
+    stage_file(stage, "DPTO1=76", "a-0.parquet", [1, 2, 3, 3])
+    stage_file(stage, "DPTO1=76", "b-0.parquet", [3, 4])
+
+    assert dedup_partitions(stage, clean) == 2
+    assert sorted(pq.read_table(clean + "DPTO1=76/data.parquet")["id"].to_pylist()) == [
+        1,
+        2,
+        3,
+        4,
+    ]
+
+
+@pytest.mark.parametrize("bits", [64, 128])
+def test_fingerprints_dedup_as_distinct(bits):
+    rows = pa.table(
+        {
+            "code": [f"{i % 50:010d}" for i in range(400)],
+            "country": [["USA", "KOR", "CHN"][i % 3] for i in range(400)],
+            "value": list(range(400)),
+        }
+    )
+    distinct = duckdb.sql(
+        "SELECT DISTINCT code, country FROM rows ORDER BY ALL"
+    ).fetchall()
+
+    for keys in [None, ["code", "country"]]:
+        data = Load(rows).purge_duplicates(keys, bits).data
+        exact = Load(rows).purge_duplicates(keys).data
+        assert data.num_rows == exact.num_rows
+        assert (
+            duckdb.sql(
+                "SELECT DISTINCT code, country FROM data ORDER BY ALL"
+            ).fetchall()
+            == distinct
+        )
+
+
+def test_untouched_partitions_are_not_rewritten(tmp_path):
+    stage, clean = f"{tmp_path}/stage/", f"{tmp_path}/clean/"
+    stage_file(stage, "DPTO1=76", "a-0.parquet", [1, 1])
+    stage_file(stage, "DPTO1=5", "a-0.parquet", [2, 2])
+    assert dedup_partitions(stage, clean) == 2
+    written = {
+        partition: os.stat(f"{clean}{partition}/data.parquet").st_mtime_ns
+        for partition in ["DPTO1=76", "DPTO1=5"]
+    }
+
+    assert dedup_partitions(stage, clean) == 0
+    stage_file(stage, "DPTO1=5", "b-0.parquet", [2, 3])
+    # The new file is newer than the clean one, even on coarse clocks.
+    future = os.path.getmtime(f"{clean}DPTO1=5/data.parquet") + 2
+    os.utime(f"{stage}DPTO1=5/b-0.parquet", (future, future))
+    assert dedup_partitions(stage, clean) == 2
+
+    assert os.stat(f"{clean}DPTO1=76/data.parquet").st_mtime_ns == written["DPTO1=76"]
+    assert os.stat(f"{clean}DPTO1=5/data.parquet").st_mtime_ns != written["DPTO1=5"]
+    assert sorted(pq.read_table(f"{clean}DPTO1=5/data.parquet")["id"].to_pylist()) == [
+        2,
+        3,
+    ]
+
+
+@pytest.mark.parametrize("side", ["left", "right", "both"])
+@pytest.mark.parametrize("width", [4, 5])
+def test_codes_are_formatted_alike(side, width):
+    codes = pa.table({"code": ["1", " 12 ", "123", "1234", "123456", ""]})
+    options = {"pad_": True, "width": width, "side": side, "fillchar": "0"}
+
+    def formatted(data) -> list[str]:
+        data = Load(data).format_commoditie_code("code", **options).data
+        if isinstance(data, duckdb.DuckDBPyRelation):
+            data = data.arrow()
+        if isinstance(data, pa.Table):
+            return data["code"].to_pylist()
+        return data["code"].tolist()
+
+    expected = [
+        {"left": code.rjust, "right": code.ljust, "both": code.center}[side](width, "0")
+        for code in [code.strip() for code in codes["code"].to_pylist()]
+    ]
+    assert formatted(duckdb.from_arrow(codes)) == expected
+    assert formatted(codes) == expected
+    assert formatted(codes.to_pandas()) == expected
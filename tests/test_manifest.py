@@ -0,0 +1,41 @@
+import sys
+
+sys.path.append("./ingest/")
+from manifest import Manifest, partition_name  # type: ignore
+
+
+def obj(key: str, etag: str = "a", size: int = 1) -> dict:
+    return {"Key": key, "ETag": etag, "Size": size, "LastModified": "2025-01-01"}
+
+
+def test_changed_objects(tmp_path):
+    stage = str(tmp_path) + "/"
+    raw = tmp_path / "raw.csv"
+    raw.write_text("x")
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    for key in ["same", "etag", "size", "files", "raw"]:
+        (tmp_path / f"{key}-0.parquet").write_text("x")
+        manifest.record(obj(key), str(raw), [f"{key}-0.parquet"])
+    manifest.save()
+    (tmp_path / "files-0.parquet").unlink()
+
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    objects = [obj("same"), obj("etag", etag="b"), obj("size", size=2), obj("files")]
+    assert manifest.changed(objects + [obj("new")], stage) == objects[1:] + [obj("new")]
+    assert manifest.removed(objects) == ["raw"]
+
+    raw.write_text("changed")
+    assert manifest.changed([obj("same")], stage) == [obj("same")]
+
+
+def test_partition_names_are_unique():
+    names = {
+        partition_name(key, "raw/")
+        for key in [
+            "raw/a/2023.csv",
+            "raw/b/2023.csv",
+            "raw/a%2F2023.csv",
+            "raw/2023.csv",
+        ]
+    }
+    assert len(names) == 4
@@ -0,0 +1,21 @@
+import os
+import sys
+
+sys.path.append("./ingest/")
+import metrics  # type: ignore
+
+
+def stages(wall: float) -> list[dict]:
+    return [{"name": "unify_csv", "wall": wall, "cpu": wall, "peak-rss": 1}]
+
+
+def test_back_to_back_reports_are_kept_and_compared(tmp_path, capsys):
+    first = metrics.save_report("exports", "clean", stages(1.0), 1.0, str(tmp_path))
+    second = metrics.save_report("exports", "clean", stages(9.0), 9.0, str(tmp_path))
+
+    assert first != second
+    assert sorted(os.listdir(tmp_path / "exports")) == [
+        os.path.basename(first),
+        os.path.basename(second),
+    ]
+    assert "unify_csv took 9.00s, 1.00s in the previous run" in capsys.readouterr().out
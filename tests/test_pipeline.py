@@ -0,0 +1,145 @@
+import os
+import csv
+import sys
+import duckdb
+import pytest
+
+sys.path.append("./ingest/")
+sys.path.append("./benchmarks/")
+import config  # type: ignore
+import pipeline  # type: ignore
+import s3  # type: ignore
+from generators import write_csv  # type: ignore
+
+
+@pytest.fixture
+def exports(bucket, tmp_path, monkeypatch):
+    """The exports dataset, raw objects in bucket and local files in tmp_path."""
+    monkeypatch.setattr(pipeline, "BUCKET", bucket)
+    monkeypatch.setattr(config.Execution, "File_Jobs", 1)
+    monkeypatch.setattr(config.Metrics, "Enabled", False)
+    dataset = config.datasets["exports"]
+    for name in ["local-stage", "local-clean", "local-rejects"]:
+        monkeypatch.setitem(dataset, name, f"{tmp_path}/exports/{name}/")
+    monkeypatch.setitem(dataset, "manifest", f"{tmp_path}/exports/manifest.json")
+    return dataset
+
+
+def put_raw(dataset: dict, bucket: str, tmp_path, name: str, seed: int):
+    path = write_csv("exports", str(tmp_path / "generated" / f"{seed}.csv"), 200, seed)
+    s3.get_s3_client().upload_file(path, bucket, dataset["s3-raw"] + name)
+
+
+def clean_rows(dataset: dict) -> int:
+    return duckdb.sql(
+        f"SELECT count(*) FROM read_parquet('{dataset['local-clean']}*/*.parquet')"
+    ).fetchone()[0]  # type: ignore
+
+
+def test_remote_read(exports, bucket, tmp_path, monkeypatch):
+    monkeypatch.setattr(config.Execution, "Remote_Read", True)
+    put_raw(exports, bucket, tmp_path, "2023.csv", 0)
+
+    pipeline._clean_dataset("exports", 1)
+
+    assert clean_rows(exports) > 0
+    assert not os.path.exists(tmp_path / exports["s3-raw"])
+    assert (
+        pipeline.Manifest(exports["manifest"])
+        .entries[exports["s3-raw"] + "2023.csv"]["raw-file"]
+        .startswith("s3://")
+    )
+
+
+def test_remote_read_needs_credentials(exports, tmp_path, monkeypatch):
+    for name in ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"]:
+        monkeypatch.delenv(name)
+    monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", str(tmp_path / "missing"))
+    monkeypatch.setenv("AWS_CONFIG_FILE", str(tmp_path / "missing"))
+    monkeypatch.setenv("AWS_EC2_METADATA_DISABLED", "true")
+
+    with pytest.raises(ValueError, match="No AWS credentials"):
+        s3.register_duckdb_secret(duckdb.connect())
+
+
+def put_bad_raw(dataset: dict, bucket: str, tmp_path, name: str, seed: int):
+    path = write_csv("exports", str(tmp_path / "generated" / f"{seed}.csv"), 200, seed)
+    with open(path) as file:
+        header, row = file.readline(), file.readline()
+    columns, values = csv.reader([header, row])
+    values[columns.index("FOBPES")] = "n/d"
+    bad = tmp_path / "generated" / f"{seed}-bad.csv"
+    with open(path) as source, open(bad, "w", newline="") as file:
+        file.write(source.read())
+        csv.writer(file, lineterminator="\n").writerow(values)
+    s3.get_s3_client().upload_file(str(bad), bucket, dataset["s3-raw"] + name)
+
+
+def test_only_changed_objects_are_cleaned(exports, bucket, tmp_path, monkeypatch):
+    put_raw(exports, bucket, tmp_path, "2022.csv", 0)
+    put_raw(exports, bucket, tmp_path, "2023.csv", 1)
+    pipeline._clean_dataset("exports", 1)
+    rows = clean_rows(exports)
+
+    cleaned = []
+    clean_file = pipeline.clean_file
+
+    def spy(key, raw_file, basename, processes):
+        cleaned.append(basename)
+        return clean_file(key, raw_file, basename, processes)
+
+    monkeypatch.setattr(pipeline, "clean_file", spy)
+    pipeline._clean_dataset("exports", 1)
+    assert cleaned == []
+    assert clean_rows(exports) == rows
+
+    put_raw(exports, bucket, tmp_path, "2023.csv", 2)
+    put_raw(exports, bucket, tmp_path, "2024.csv", 3)
+    pipeline._clean_dataset("exports", 1)
+    assert sorted(cleaned) == ["2023", "2024"]
+
+
+def test_removed_objects_files_are_deleted(exports, bucket, tmp_path):
+    put_raw(exports, bucket, tmp_path, "2022.csv", 0)
+    put_bad_raw(exports, bucket, tmp_path, "2023.csv", 1)
+    pipeline._clean_dataset("exports", 1)
+
+    manifest = pipeline.Manifest(exports["manifest"])
+    entry = manifest.entries[exports["s3-raw"] + "2023.csv"]
+    paths = [
+        entry["raw-file"],
+        exports["local-rejects"] + "2023.parquet",
+        *(exports["local-stage"] + file for file in entry["files"]),
+    ]
+    assert entry["files"] and all(os.path.exists(path) for path in paths)
+
+    s3.get_s3_client().delete_object(Bucket=bucket, Key=exports["s3-raw"] + "2023.csv")
+    pipeline._clean_dataset("exports", 1)
+
+    assert not any(os.path.exists(path) for path in paths)
+    assert list(pipeline.Manifest(exports["manifest"]).entries) == [
+        exports["s3-raw"] + "2022.csv"
+    ]
+
+
+def test_stale_basename_files_are_removed(exports, bucket, tmp_path):
+    put_raw(exports, bucket, tmp_path, "2023.csv", 0)
+    pipeline._clean_dataset("exports", 1)
+
+    # Files of the object from a run that named them after another basename.
+    manifest = pipeline.Manifest(exports["manifest"])
+    entry = manifest.entries[exports["s3-raw"] + "2023.csv"]
+    stale = [file.replace("2023-", "exports%2F2023-") for file in entry["files"]]
+    for file, stale_file in zip(entry["files"], stale):
+        os.replace(exports["local-stage"] + file, exports["local-stage"] + stale_file)
+    entry["files"] = stale
+    manifest.save()
+
+    put_raw(exports, bucket, tmp_path, "2023.csv", 1)
+    pipeline._clean_dataset("exports", 1)
+
+    assert not any(os.path.exists(exports["local-stage"] + file) for file in stale)
+    files = pipeline.Manifest(exports["manifest"]).entries[
+        exports["s3-raw"] + "2023.csv"
+    ]["files"]
+    assert all(os.path.exists(exports["local-stage"] + file) for file in files)
@@ -0,0 +1,92 @@
+import sys
+
+sys.path.append("./ingest/")
+import s3  # type: ignore
+
+
+def put(bucket: str, key: str, body: bytes = b"x"):
+    s3.get_s3_client().put_object(Bucket=bucket, Key=key, Body=body)
+
+
+def test_objects_are_listed_past_a_page(bucket):
+    keys = [f"raw/{i:04d}.csv" for i in range(1_205)]
+    for key in keys:
+        put(bucket, key)
+
+    assert [obj["Key"] for obj in s3.get_objects(bucket, "raw/", "raw/")] == keys
+
+
+def test_objects_are_filtered(bucket):
+    put(bucket, "raw/a.csv", b"a" * 10)
+    put(bucket, "raw/b.csv", b"b" * 100)
+    put(bucket, "raw/c.txt", b"c" * 10)
+    put(bucket, "raw/d.csv", b"d" * 1_000)
+    put(bucket, "clean/e.csv", b"e" * 10)
+
+    def keys(start_after: str = "raw/", **filters) -> list[str]:
+        return [
+            obj["Key"]
+            for obj in s3.iter_objects(bucket, "raw/", start_after, **filters)
+        ]
+
+    assert keys() == ["raw/a.csv", "raw/b.csv", "raw/c.txt", "raw/d.csv"]
+    assert keys("raw/b.csv") == ["raw/c.txt", "raw/d.csv"]
+    assert keys(suffix=".csv") == ["raw/a.csv", "raw/b.csv", "raw/d.csv"]
+    assert keys(suffix=".csv", min_size=50, max_size=500) == ["raw/b.csv"]
+
+
+def test_objects_are_downloaded(bucket, tmp_path):
+    for i in range(20):
+        put(bucket, f"raw/{i:02d}.csv", str(i).encode())
+
+    assert s3.download_object(bucket, "raw/", "raw/")
+    assert sorted(path.name for path in (tmp_path / "raw").iterdir()) == [
+        f"{i:02d}.csv" for i in range(20)
+    ]
+    assert (tmp_path / "raw" / "07.csv").read_text() == "7"
+    # A directory with data isn't downloaded again.
+    assert not s3.download_object(bucket, "raw/", "raw/")
+
+
+def test_failed_uploads_are_reported(bucket, tmp_path):
+    file = tmp_path / "data.parquet"
+    file.write_bytes(b"x")
+
+    assert s3.upload_objects([(str(file), "clean/data.parquet")], bucket)
+    assert not s3.upload_objects(
+        [(str(file), "clean/data.parquet")], bucket + "-missing"
+    )
+    assert not s3.upload_object(str(file), bucket + "-missing", "clean/data.parquet")
+
+
+def test_sync_transfers_changes_only(bucket, tmp_path, monkeypatch):
+    clean = tmp_path / "clean"
+    (clean / "DPTO1=76").mkdir(parents=True)
+    (clean / "DPTO1=76" / "data.parquet").write_bytes(b"a")
+    (clean / "DPTO1=5").mkdir()
+    (clean / "DPTO1=5" / "data.parquet").write_bytes(b"b")
+
+    uploads = []
+    upload_objects = s3.upload_objects
+
+    def spy(files, bucket):
+        uploads.append(sorted(key for _, key in files))
+        return upload_objects(files, bucket)
+
+    monkeypatch.setattr(s3, "upload_objects", spy)
+
+    def keys() -> list[str]:
+        return [obj["Key"] for obj in s3.iter_objects(bucket, "clean/", "clean/")]
+
+    assert s3.sync_objects(str(clean) + "/", bucket, "clean/")
+    assert uploads == [["clean/DPTO1=5/data.parquet", "clean/DPTO1=76/data.parquet"]]
+
+    # Synced right after the upload, within the same second.
+    assert s3.sync_objects(str(clean) + "/", bucket, "clean/")
+    assert len(uploads) == 1
+
+    (clean / "DPTO1=5" / "data.parquet").unlink()
+    (clean / "DPTO1=76" / "data.parquet").write_bytes(b"aa")
+    assert s3.sync_objects(str(clean) + "/", bucket, "clean/")
+    assert uploads[1:] == [["clean/DPTO1=76/data.parquet"]]
+    assert keys() == ["clean/DPTO1=76/data.parquet"]
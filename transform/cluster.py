@@ -0,0 +1,231 @@
+"""K-means clustering of the transform phase.
+
+This module fits the K-means models of the cluster tables declared in
+tables.py, replacing the transform/model notebooks. Each model reads its
+rows through duckdb as Arrow, standardizes its features in a numpy
+array and labels each row with its cluster.
+
+The number of clusters is chosen among config.Cluster.K: every candidate
+is fitted on a sample of the rows, in a process pool shared by all
+models, so the candidates of all datasets are fitted at the same time.
+The chosen model is then fitted on all rows, with MiniBatchKMeans for
+large inputs, and the labels are written back to duckdb from Arrow.
+
+scikit-learn and numpy are imported by the functions using them, so
+importing the transform phase stays cheap.
+
+Attributes:
+    model_pool: starts the process pool fitting the candidates.
+    fit_candidate: fits a candidate number of clusters on a sample.
+    choose_k: chooses the number of clusters among the fitted candidates.
+    cluster_table: creates a cluster table from its model declaration.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+import typing
+import multiprocessing
+import pyarrow as pa
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+if typing.TYPE_CHECKING:
+    import duckdb
+    import numpy as np
+
+sys.path.append("./ingest/")
+import config  # type: ignore
+from load import create_table, quote  # type: ignore
+
+
+def model_pool() -> ProcessPoolExecutor:
+    """Starts the process pool fitting the candidates of all models.
+
+    It has config.Cluster.Jobs workers, started once a candidate is
+    submitted. The connection building the tables next to it must leave
+    them their share of config.Resources (see config.Cluster.Jobs).
+    """
+    return ProcessPoolExecutor(
+        max_workers=config.Cluster.Jobs,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def fit_candidate(sample: np.ndarray, k: int, selection: str, seed: int) -> dict:
+    """Fits a candidate number of clusters on a sample.
+
+    Runs in a worker process, on a single thread, since the candidates
+    of all models are fitted at the same time.
+
+    Args:
+        sample (np.ndarray): standardized features of the sample rows.
+        k (int): number of clusters.
+        selection (str): config.Cluster.Selection, the silhouette score is
+          only computed when it's used.
+        seed (int): random seed.
+
+    Returns:
+        The candidate "k", its "inertia" and its "silhouette" score, None
+        if it isn't computed or defined.
+    """
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+    from threadpoolctl import threadpool_limits
+
+    with threadpool_limits(1):
+        model = KMeans(n_clusters=k, n_init="auto", random_state=seed).fit(sample)
+        silhouette = None
+        if selection == "silhouette" and 1 < k < len(sample):
+            silhouette = float(silhouette_score(sample, model.labels_))
+
+    return {"k": k, "inertia": float(model.inertia_), "silhouette": silhouette}
+
+
+def choose_k(candidates: list[dict], selection: str) -> int:
+    """Chooses the number of clusters among the fitted candidates.
+
+    By "silhouette", the candidate with the best silhouette score is
+    chosen. By "elbow", the candidate whose inertia lies farthest below
+    the line joining the inertias of the first and last candidates, the
+    point where adding clusters stops paying off.
+
+    Args:
+        candidates (list[dict]): candidates, as returned by fit_candidate.
+        selection (str): "elbow" or "silhouette".
+
+    Returns:
+        The chosen number of clusters.
+
+    Raises:
+        ValueError: if selection isn't supported.
+    """
+    import numpy as np
+
+    candidates = sorted(candidates, key=lambda candidate: candidate["k"])
+    if selection == "silhouette":
+        scored = [c for c in candidates if c["silhouette"] is not None]
+        if scored:
+            return max(scored, key=lambda candidate: candidate["silhouette"])["k"]
+        return candidates[0]["k"]
+    if selection != "elbow":
+        raise ValueError(f"Cluster selection '{selection}' is not supported")
+
+    ks = np.array([candidate["k"] for candidate in candidates], dtype=np.float64)
+    inertias = np.array([candidate["inertia"] for candidate in candidates])
+    if len(ks) < 3 or inertias[0] <= inertias[-1]:
+        return candidates[0]["k"]
+    # Both axes scaled to [0, 1], the line goes from (0, 1) to (1, 0).
+    x = (ks - ks[0]) / (ks[-1] - ks[0])
+    y = (inertias - inertias[-1]) / (inertias[0] - inertias[-1])
+    return candidates[int(np.argmax(1 - x - y))]["k"]
+
+
+def cluster_table(
+    connection: duckdb.DuckDBPyConnection,
+    table: str,
+    query: str,
+    model: dict,
+    pool: Executor,
+):
+    """Creates or replaces a cluster table from its model declaration.
+
+    The table holds the query rows, with the features standardized and
+    a "kmeans" column labelling the cluster of each row. Rows with a NULL
+    feature can't be clustered and are left out of the table.
+
+    Typical example:
+        cluster_table(
+            connection,
+            "cluster_valle_world_exports",
+            "SELECT POSAR, FOBPES, CAST(FOBPES AS DOUBLE) FOBPES_T FROM valle_exports",
+            {"features": ["FOBPES_T"], "k": [1, 2, 3]},
+            pool,
+        )
+
+    Args:
+        connection (DuckDBPyConnection): duckdb connection.
+        table (str): table name.
+        query (str): query selecting the table rows.
+        model (dict): "features", the query columns clustered on, and "k",
+          the candidate numbers of clusters.
+        pool (Executor): process pool fitting the candidates.
+    """
+    import numpy as np
+    import pyarrow.compute as pc
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    start = time.perf_counter()
+    data = connection.sql(query).arrow()
+    rows = data.num_rows
+    for column in model["features"]:
+        data = data.filter(pc.is_valid(data[column]))
+    dropped = rows - data.num_rows
+    rows = data.num_rows
+
+    # Column-major, so each standardized feature is a contiguous column
+    # that Arrow can wrap without copying it.
+    features = np.empty((rows, len(model["features"])), order="F")
+    for i, column in enumerate(model["features"]):
+        features[:, i] = pc.cast(data[column], pa.float64()).to_numpy()
+    if rows:
+        features -= features.mean(axis=0)
+        std = features.std(axis=0)
+        features /= np.where(std > 0, std, 1)
+
+    rng = np.random.default_rng(config.Cluster.Seed)
+    sample = features[
+        np.sort(rng.choice(rows, min(rows, config.Cluster.Sample_Rows), replace=False))
+    ]
+    candidates = [
+        future.result()
+        for future in [
+            pool.submit(
+                fit_candidate,
+                sample,
+                k,
+                config.Cluster.Selection,
+                config.Cluster.Seed,
+            )
+            for k in model["k"]
+            if k <= len(sample)
+        ]
+    ]
+
+    labels = np.zeros(rows, dtype=np.int32)
+    k = 1
+    if candidates:
+        k = choose_k(candidates, config.Cluster.Selection)
+        if rows > config.Cluster.Mini_Batch_Rows:
+            estimator = MiniBatchKMeans(
+                n_clusters=k,
+                batch_size=config.Cluster.Batch_Size,
+                n_init="auto",
+                random_state=config.Cluster.Seed,
+            )
+        else:
+            estimator = KMeans(
+                n_clusters=k, n_init="auto", random_state=config.Cluster.Seed
+            )
+        labels = estimator.fit(features).labels_.astype(np.int32, copy=False)
+
+    for i, column in enumerate(model["features"]):
+        data = data.set_column(
+            data.schema.get_field_index(column), column, pa.array(features[:, i])
+        )
+    data = data.append_column("kmeans", pa.array(labels))
+
+    view = f"{table}_clusters"
+    connection.register(view, data)
+    try:
+        create_table(connection, table, f"SELECT * FROM {quote(view)}", [])
+    finally:
+        connection.unregister(view)
+
+    print(
+        f"{table}: {k} clusters chosen by {config.Cluster.Selection} among "
+        f"{len(candidates)} candidates, {rows:,} rows in "
+        f"{time.perf_counter() - start:.2f}s.\n"
+    )
+    if dropped:
+        print(f"{table}: {dropped:,} rows with NULL features were left out.\n")
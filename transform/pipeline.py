@@ -1,17 +1,363 @@
-import os, sys
+"""Executable of the transform phase.
+
+This module builds the duckdb database tables declared in tables.py,
+saves the dashboard snapshot and uploads the database to S3.
+
+Tables are built incrementally: each table has a fingerprint, the
+content hash of its query, its parquet sources and the fingerprints
+of the tables it depends on. Tables can be views over their parquet
+sources (see config.Transform.Source_Views). Only tables whose fingerprint changed
+since the last build, or that are missing, are rebuilt. Independent
+tables are built concurrently, and the K-means candidates of the
+cluster tables are fitted in a process pool shared by all of them.
+After the build, a database file left mostly free, e.g. by replacing
+tables with views, is compacted.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import graphlib
+from concurrent.futures import (
+    Executor,
+    ThreadPoolExecutor,
+    wait,
+    FIRST_COMPLETED,
+)
 import duckdb
 
-sys.path.append("/workspaces/talento_tech/ingest/")
+sys.path.append("./ingest/")
 import config, s3  # type: ignore
+from load import create_table, quote, set_resources  # type: ignore
+from tables import tables
+from cluster import cluster_table, model_pool
+
+sys.path.append("./visualize/")
+from snapshot import write_snapshot  # type: ignore
+
+
+def load_state(path: str) -> dict:
+    """Loads the build state, or an empty one if there isn't any.
+
+    Args:
+        path (str): state json file path.
+    """
+    if os.path.exists(path):
+        with open(path) as file:
+            return json.load(file)
+    return {"files": {}, "tables": {}}
+
+
+def save_state(state: dict, path: str):
+    """Saves the build state, replacing the previous one atomically.
+
+    Args:
+        state (dict): build state.
+        path (str): state json file path.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w") as file:
+        json.dump(state, file, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def hash_file(path: str, files: dict) -> str:
+    """Content hash of a file.
+
+    Hashes are cached in files by path, and only recomputed when the
+    file size or modification time changes.
+
+    Args:
+        path (str): file path.
+        files (dict): hash cache, from the build state.
+
+    Returns:
+        The sha256 hex digest of the file.
+    """
+    stat = os.stat(path)
+    cached = files.get(path)
+    if cached and cached["size"] == stat.st_size and cached["mtime"] == stat.st_mtime:
+        return cached["sha256"]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024**2), b""):
+            digest.update(chunk)
+
+    files[path] = {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sha256": digest.hexdigest(),
+    }
+    return files[path]["sha256"]
+
+
+def fingerprints(state: dict) -> dict[str, str]:
+    """Fingerprints of all tables.
+
+    Args:
+        state (dict): build state, its hash cache is updated.
+
+    Returns:
+        The fingerprint of each table.
+    """
+    prints: dict[str, str] = {}
+    sorter = graphlib.TopologicalSorter(
+        {name: table["depends-on"] for name, table in tables.items()}
+    )
+    for name in sorter.static_order():
+        table = tables[name]
+        content = {
+            "query": table["query"],
+            "dtypes": [[column, str(dtype)] for column, dtype in table["dtypes"]],
+            "view": table["view"],
+            "sources": {
+                path: hash_file(path, state["files"])
+                for pattern in table["sources"]
+                for path in sorted(glob.glob(pattern))
+            },
+            "depends-on": {dep: prints[dep] for dep in table["depends-on"]},
+        }
+        if "model" in table:
+            # Settings changing the fitted clusters, unlike Cluster.Jobs.
+            content["model"] = {
+                **table["model"],
+                "selection": config.Cluster.Selection,
+                "sample-rows": config.Cluster.Sample_Rows,
+                "mini-batch-rows": config.Cluster.Mini_Batch_Rows,
+                "batch-size": config.Cluster.Batch_Size,
+                "seed": config.Cluster.Seed,
+            }
+        prints[name] = hashlib.sha256(
+            json.dumps(content, sort_keys=True).encode()
+        ).hexdigest()
+
+    state["files"] = {
+        path: entry for path, entry in state["files"].items() if os.path.exists(path)
+    }
+    return prints
+
+
+def build_table(
+    connection: duckdb.DuckDBPyConnection, name: str, models: Executor
+) -> tuple[float, int]:
+    """Builds a table on its own cursor of the connection.
 
+    Args:
+        connection (DuckDBPyConnection): database connection.
+        name (str): table name in tables.
+        models (Executor): process pool fitting the K-means candidates.
 
-def main():
-    s3.upload_object(
-        os.path.join(config.Database.dir, config.Database.filename),
-        config.S3.Bucket,
-        config.Database.filename,
+    Returns:
+        The wall time in seconds and the number of rows of the table.
+    """
+    cursor = connection.cursor()
+    start = time.perf_counter()
+    if "model" in tables[name]:
+        cluster_table(
+            cursor, name, tables[name]["query"], tables[name]["model"], models
+        )
+    else:
+        create_table(
+            cursor,
+            name,
+            tables[name]["query"],
+            tables[name]["dtypes"],
+            view=tables[name]["view"],
+        )
+    elapsed = time.perf_counter() - start
+    rows = cursor.sql(f"SELECT count(*) FROM {quote(name)}").fetchone()[0]  # type: ignore
+    cursor.close()
+    return elapsed, rows
+
+
+def build_tables(
+    connection: duckdb.DuckDBPyConnection,
+    jobs: int = config.Transform.Jobs,
+    force: bool = False,
+) -> dict[str, tuple[str, float | None]]:
+    """Builds the stale tables of the database.
+
+    A table is stale if its fingerprint changed since its last build,
+    or if it doesn't exist. Tables are built as soon as the tables they
+    depend on are built. Tables depending on a failed table are skipped.
+
+    Args:
+        connection (DuckDBPyConnection): database connection.
+        jobs (int): maximum number of tables built at the same time.
+        force (bool): whether to rebuild all tables.
+
+    Returns:
+        The build status of each table, "built", "up to date", "failed"
+        or "skipped", and its build wall time, if it was built.
+    """
+    state = load_state(config.Transform.State)
+    prints = fingerprints(state)
+    existing = {
+        row[0]
+        for row in connection.sql(
+            "SELECT table_name FROM duckdb_tables() "
+            "UNION ALL SELECT view_name FROM duckdb_views() WHERE NOT internal"
+        ).fetchall()
+    }
+
+    status: dict[str, tuple[str, float | None]] = {}
+    sorter = graphlib.TopologicalSorter(
+        {name: table["depends-on"] for name, table in tables.items()}
     )
+    sorter.prepare()
+
+    # Workers are only started once a cluster table is built.
+    with (
+        ThreadPoolExecutor(max_workers=max(1, jobs)) as pool,
+        model_pool() as models,
+    ):
+        futures = {}
+        while sorter.is_active():
+            for name in sorter.get_ready():
+                built = state["tables"].get(name, {})
+                if any(
+                    status[dep][0] in ("failed", "skipped")
+                    for dep in tables[name]["depends-on"]
+                ):
+                    status[name] = ("skipped", None)
+                    sorter.done(name)
+                elif (
+                    not force
+                    and name in existing
+                    and built.get("fingerprint") == prints[name]
+                ):
+                    status[name] = ("up to date", None)
+                    sorter.done(name)
+                else:
+                    futures[pool.submit(build_table, connection, name, models)] = name
+
+            if not futures:
+                continue
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures.pop(future)
+                try:
+                    elapsed, rows = future.result()
+                except Exception as e:
+                    print(f"There was an error building {name}: {e}\n")
+                    status[name] = ("failed", None)
+                    state["tables"].pop(name, None)
+                else:
+                    status[name] = ("built", elapsed)
+                    state["tables"][name] = {
+                        "fingerprint": prints[name],
+                        "built-at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                        "elapsed": round(elapsed, 3),
+                        "rows": rows,
+                    }
+                save_state(state, config.Transform.State)
+                sorter.done(name)
+
+    save_state(state, config.Transform.State)
+    return status
+
+
+def compact_database(
+    database: str, free_share: float = config.Transform.Compact_Free
+) -> bool:
+    """Rewrites the database file without its free blocks.
+
+    duckdb reuses the blocks of dropped or replaced tables, but doesn't
+    give them back to the file system, not even on CHECKPOINT. So when
+    source tables are replaced by views (see config.Transform.Source_Views)
+    the file doesn't get smaller. Once free blocks are over free_share
+    of the file, the database is copied into a new file that replaces it.
+
+    Args:
+        database (str): duckdb database path.
+        free_share (float): share of free blocks over which it's compacted.
+
+    Returns:
+        Whether the database was compacted.
+    """
+    with duckdb.connect(database, read_only=True) as connection:
+        total, free = connection.sql(
+            "SELECT total_blocks, free_blocks FROM pragma_database_size()"
+        ).fetchone()  # type: ignore
+    if not total or free / total <= free_share:
+        return False
+
+    size = os.path.getsize(database)
+    compact = database + ".compact"
+    if os.path.exists(compact):
+        os.remove(compact)
+    with duckdb.connect() as connection:
+        set_resources(connection)
+        connection.execute(
+            "ATTACH '" + database.replace("'", "''") + "' AS build (READ_ONLY);"
+            "ATTACH '" + compact.replace("'", "''") + "' AS compact;"
+            "COPY FROM DATABASE build TO compact;"
+        )
+    os.replace(compact, database)
+
+    print(
+        f"{database} compacted from {size / 1024**2:.1f} MB "
+        f"to {os.path.getsize(database) / 1024**2:.1f} MB.\n"
+    )
+    return True
+
+
+def main(arg: str, jobs: int = config.Transform.Jobs, force: bool = False):
+    database = os.path.join(config.Database.dir, config.Database.filename)
+
+    if arg == "build" or arg == "all":
+        os.makedirs(config.Database.dir, exist_ok=True)
+        with duckdb.connect(database) as connection:
+            # The K-means workers are charged half the budget.
+            set_resources(
+                connection,
+                processes=2 if any("model" in t for t in tables.values()) else 1,
+            )
+            status = build_tables(connection, jobs=jobs, force=force)
+            write_snapshot(
+                connection,
+                config.Dashboard.Snapshot,
+                {
+                    name: table["fingerprint"]
+                    for name, table in load_state(config.Transform.State)[
+                        "tables"
+                    ].items()
+                },
+            )
+        compact_database(database)
+
+        print("Build summary:")
+        for name in tables:
+            table_status, elapsed = status[name]
+            timing = f" in {elapsed:.2f}s" if elapsed is not None else ""
+            print(f"  {name}: {table_status}{timing}")
+        print()
+
+        failed = [
+            name
+            for name, (table_status, _) in status.items()
+            if table_status == "failed"
+        ]
+        if failed:
+            raise RuntimeError(f"Building failed for {', '.join(failed)}")
+
+    if arg == "upload" or arg == "all":
+        if not s3.upload_object(database, config.S3.Bucket, config.Database.filename):
+            raise RuntimeError(f"{database} was not uploaded to S3")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Transform phase.")
+    parser.add_argument(
+        "arg", nargs="?", default="all", choices=["build", "upload", "all"]
+    )
+    parser.add_argument("--jobs", type=int, default=config.Transform.Jobs)
+    parser.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+    main(args.arg, jobs=args.jobs, force=args.force)
@@ -0,0 +1,266 @@
+"""Tables of the transform phase.
+
+This module declares the tables of the duckdb database as a dependency
+graph, so the transform pipeline can build them in order and only
+rebuild the ones whose query, parquet sources or upstream tables changed.
+
+The top tables of each source are derived from a rollup table, which
+aggregates the source by all their groupings in a single scan. The
+cluster tables label the rows of their query with a K-means model
+(see cluster.py), either the transaction rows of the source or their
+aggregates by commodity code (see config.Cluster.Aggregate).
+
+Each table is declared by:
+    query: query selecting the table rows.
+    sources: glob patterns of the parquet files the query reads.
+    depends-on: tables the query reads.
+    dtypes: column-dtype pairs, as config.Exports.Dtypes. Dictionary
+      columns are stored as ENUM types (see load.create_table).
+    view: whether the table is a view instead (see load.create_table).
+    model: optional, K-means model labelling the query rows, its
+      "features" columns and "k" candidate numbers of clusters (see
+      cluster.cluster_table).
+
+Attributes:
+    cluster_declaration: declares a cluster table of a source.
+    tables: collection of table declarations.
+"""
+
+import typing
+import config  # type: ignore
+
+EXPORTS = config.Local_Dir.Exports["clean"] + "*/*.parquet"
+KOREA_IMPORTS = config.Local_Dir.Korea_Imports["clean"] + "*/*.parquet"
+
+
+def cluster_declaration(
+    source: str, code: str, value: str, where: str, partner: str | None = None
+) -> dict[str, typing.Any]:
+    """Declares a cluster table of a source.
+
+    By default, each transaction row is clustered by its commodity code
+    and value. With config.Cluster.Aggregate, the rows are aggregated in
+    duckdb by commodity code, and partner if given, and each aggregate
+    is clustered by its total value, number of transactions and mean
+    value, log scaled, and by its share of the commodity total when
+    partners are kept apart. The table then has one row per aggregate,
+    with its total in the value column, so it charts as the row one.
+
+    Args:
+        source (str): table the rows are read from.
+        code (str): commodity code column.
+        value (str): monetary value column.
+        where (str): condition selecting the rows.
+        partner (str | None): partner column the aggregates are split by.
+    """
+    if not config.Cluster.Aggregate:
+        query = f"""SELECT {code}, {value},
+            CAST(CAST({code} AS VARCHAR) AS DOUBLE) {code}_T,
+            CAST({value} AS DOUBLE) {value}_T
+        FROM {source}
+        WHERE {where}"""
+        features = [f"{code}_T", f"{value}_T"]
+    else:
+        keys = f"{code}, {partner}" if partner else code
+        share = f"""CAST(SUM({value}) AS DOUBLE)
+                / SUM(SUM({value})) OVER ({f"PARTITION BY {code}" if partner else ""})"""
+        features = ["total_T", "transactions_T", "mean_T"]
+        if partner:
+            features.append("share_T")
+        query = f"""SELECT {keys},
+            SUM({value}) {value},
+            COUNT(*) transactions,
+            {share} value_share,
+            LN(1 + GREATEST(CAST(SUM({value}) AS DOUBLE), 0)) total_T,
+            LN(COUNT(*)) transactions_T,
+            LN(1 + GREATEST(CAST(AVG({value}) AS DOUBLE), 0)) mean_T
+            {f", COALESCE({share}, 0) share_T" if partner else ""}
+        FROM {source}
+        WHERE {where}
+        GROUP BY {keys}"""
+
+    return {
+        "query": query,
+        "sources": [],
+        "depends-on": [source],
+        "dtypes": [],
+        "view": False,
+        "model": {"features": features, "k": config.Cluster.K},
+    }
+
+
+tables: dict[str, dict[str, typing.Any]] = {
+    "valle_exports": {
+        "query": f"""SELECT * FROM read_parquet(
+            '{EXPORTS}',
+            hive_partitioning = true,
+            hive_types = {{'DPTO1': UTINYINT}}
+        )""",
+        "sources": [EXPORTS],
+        "depends-on": [],
+        "dtypes": config.Exports.Dtypes,
+        "view": config.Transform.Source_Views,
+    },
+    "valle_exports_rollup": {
+        "query": """SELECT DPTO1, POSAR, COD_PAI4,
+            SUM(FOBPES) TOTAL_FOBPES,
+            SUM(AGRENA) TOTAL_AGRENA,
+            CASE GROUPING(POSAR, COD_PAI4)
+                WHEN 0 THEN 'POSAR, COD_PAI4'
+                WHEN 1 THEN 'POSAR'
+                WHEN 2 THEN 'COD_PAI4'
+                ELSE 'DPTO1'
+            END grouping_set
+        FROM valle_exports
+        WHERE MODAD = 198
+        GROUP BY GROUPING SETS (
+            (DPTO1),
+            (DPTO1, POSAR),
+            (DPTO1, COD_PAI4),
+            (DPTO1, POSAR, COD_PAI4)
+        )""",
+        "sources": [],
+        "depends-on": ["valle_exports"],
+        "dtypes": [],
+        "view": False,
+    },
+    "top_valle_dptos": {
+        "query": """SELECT DPTO1, TOTAL_FOBPES
+        FROM valle_exports_rollup
+        WHERE grouping_set = 'DPTO1'
+        AND DPTO1 <> 0
+        ORDER BY TOTAL_FOBPES desc""",
+        "sources": [],
+        "depends-on": ["valle_exports_rollup"],
+        "dtypes": [],
+        "view": False,
+    },
+    "top_valle_exports": {
+        "query": """SELECT POSAR, TOTAL_FOBPES
+        FROM valle_exports_rollup
+        WHERE grouping_set = 'POSAR'
+        AND DPTO1 = 76
+        ORDER BY TOTAL_FOBPES desc""",
+        "sources": [],
+        "depends-on": ["valle_exports_rollup"],
+        "dtypes": [],
+        "view": False,
+    },
+    "top_valle_agrena": {
+        "query": """SELECT POSAR, TOTAL_AGRENA
+        FROM valle_exports_rollup
+        WHERE grouping_set = 'POSAR'
+        AND DPTO1 = 76
+        ORDER BY TOTAL_AGRENA desc""",
+        "sources": [],
+        "depends-on": ["valle_exports_rollup"],
+        "dtypes": [],
+        "view": False,
+    },
+    "top_valle_destinations": {
+        "query": """SELECT COD_PAI4, TOTAL_FOBPES
+        FROM valle_exports_rollup
+        WHERE grouping_set = 'COD_PAI4'
+        AND DPTO1 = 76
+        ORDER BY TOTAL_FOBPES desc""",
+        "sources": [],
+        "depends-on": ["valle_exports_rollup"],
+        "dtypes": [],
+        "view": False,
+    },
+    "top_valle_exports_to_korea": {
+        "query": """SELECT POSAR, TOTAL_FOBPES
+        FROM valle_exports_rollup
+        WHERE grouping_set = 'POSAR, COD_PAI4'
+        AND DPTO1 = 76
+        AND COD_PAI4 = 'KOR'
+        ORDER BY TOTAL_FOBPES desc""",
+        "sources": [],
+        "depends-on": ["valle_exports_rollup"],
+        "dtypes": [],
+        "view": False,
+    },
+    "cluster_valle_world_exports": cluster_declaration(
+        "valle_exports",
+        "POSAR",
+        "FOBPES",
+        "MODAD = 198 AND DPTO1 = 76",
+        partner="COD_PAI4",
+    ),
+    "cluster_valle_korea_exports": cluster_declaration(
+        "valle_exports",
+        "POSAR",
+        "FOBPES",
+        "MODAD = 198 AND DPTO1 = 76 AND COD_PAI4 = 'KOR'",
+    ),
+    "korea_imports": {
+        "query": f"""SELECT * FROM read_parquet(
+            '{KOREA_IMPORTS}',
+            hive_partitioning = true,
+            hive_types = {{'cmdCode': UTINYINT}}
+        )""",
+        "sources": [KOREA_IMPORTS],
+        "depends-on": [],
+        "dtypes": config.Korea_Imports.Dtypes,
+        "view": config.Transform.Source_Views,
+    },
+    "korea_imports_rollup": {
+        "query": """SELECT partnerDesc, cmdCode, SUM(primaryValue) totalValue
+        FROM korea_imports
+        GROUP BY partnerDesc, cmdCode""",
+        "sources": [],
+        "depends-on": ["korea_imports"],
+        "dtypes": [],
+        "view": False,
+    },
+    "top_korea_imports": {
+        "query": """SELECT cmdCode, SUM(totalValue) totalValue
+        FROM korea_imports_rollup
+        WHERE partnerDesc = 'World'
+        GROUP BY cmdCode
+        ORDER BY totalValue desc""",
+        "sources": [],
+        "depends-on": ["korea_imports_rollup"],
+        "dtypes": [],
+        "view": False,
+    },
+    "top_korea_imports_from_main_partners": {
+        "query": """SELECT cmdCode, SUM(totalValue) totalValue
+        FROM korea_imports_rollup
+        WHERE partnerDesc IN ('China', 'USA')
+        GROUP BY cmdCode
+        ORDER BY totalValue desc""",
+        "sources": [],
+        "depends-on": ["korea_imports_rollup"],
+        "dtypes": [],
+        "view": False,
+    },
+    "top_korea_imports_from_iberoamerica": {
+        "query": """SELECT cmdCode, SUM(totalValue) totalValue
+        FROM korea_imports_rollup
+        WHERE partnerDesc NOT IN ('China', 'USA', 'World', 'Colombia')
+        GROUP BY cmdCode
+        ORDER BY totalValue desc""",
+        "sources": [],
+        "depends-on": ["korea_imports_rollup"],
+        "dtypes": [],
+        "view": False,
+    },
+    "top_korea_imports_from_colombia": {
+        "query": """SELECT cmdCode, SUM(totalValue) totalValue
+        FROM korea_imports_rollup
+        WHERE partnerDesc = 'Colombia'
+        GROUP BY cmdCode
+        ORDER BY totalValue desc""",
+        "sources": [],
+        "depends-on": ["korea_imports_rollup"],
+        "dtypes": [],
+        "view": False,
+    },
+    "cluster_korea_world_imports": cluster_declaration(
+        "korea_imports", "cmdCode", "primaryValue", "partnerDesc = 'World'"
+    ),
+    "cluster_korea_colombia_imports": cluster_declaration(
+        "korea_imports", "cmdCode", "primaryValue", "partnerDesc = 'Colombia'"
+    ),
+}
@@ -0,0 +1,70 @@
+"""Database connections of the dashboard.
+
+This module opens the read-only connections the dashboard queries the
+database with. Connections are short-lived, opened for a query or an
+explorer page and closed right after, so the dashboard never holds the
+database file lock while the transform phase rebuilds it.
+
+Connections are sandboxed, since dashboard visitors write explorer
+queries: duckdb can't read files or URLs other than the database, so
+table functions as read_text or read_csv are rejected, and the
+configuration is locked so queries can't lift the sandbox.
+
+Attributes:
+    connect: opens a read-only connection to the database.
+"""
+
+import sys
+import duckdb
+
+sys.path.append("./ingest/")
+import config  # type: ignore
+
+
+def connect(
+    database: str = config.Dashboard.Database, profile: str | None = None
+) -> duckdb.DuckDBPyConnection:
+    """Opens a sandboxed, read-only connection to the database.
+
+    Its memory and threads are bounded by config.Dashboard, apart from
+    the budget of the pipeline phases, so the dashboard can run next to
+    them. External access is disabled, except for the clean dataset
+    directories when the source tables are views over them (see
+    config.Transform.Source_Views). Close it as soon as the query is done.
+
+    Typical example:
+        with connect() as connection:
+            data = connection.sql("SELECT * FROM top_valle_exports").df()
+
+    Args:
+        database (str): duckdb database path.
+        profile (str | None): json file the query profile is written to.
+          Profiling can't be enabled once the configuration is locked.
+    """
+    connection = duckdb.connect(
+        database,
+        read_only=True,
+        config={
+            "memory_limit": config.Dashboard.Memory_Limit,
+            "threads": config.Dashboard.Threads,
+            "temp_directory": config.Dashboard.Temp_Dir,
+        },
+    )
+    # Allowed directories can only be set while external access is enabled.
+    if config.Transform.Source_Views:
+        connection.execute(
+            "SET allowed_directories = $directories",
+            {
+                "directories": [
+                    config.Local_Dir.Exports["clean"],
+                    config.Local_Dir.Korea_Imports["clean"],
+                ]
+            },
+        )
+    connection.execute("SET enable_external_access = false")
+    if profile is not None:
+        connection.execute(
+            f"SET enable_profiling = 'json';SET profiling_output = '{profile}';"
+        )
+    connection.execute("SET lock_configuration = true")
+    return connection
@@ -0,0 +1,126 @@
+"""SQL explorer of the dashboard.
+
+This module runs the queries written in the dashboard explorer safely:
+a single SELECT statement at a time, on a sandboxed read-only
+connection opened for the page (see database.connect), paginated and
+bounded in rows and time.
+
+Attributes:
+    run_query: runs a page of an explorer query.
+    explorer: renders a SQL explorer in a dashboard container.
+"""
+
+import os
+import sys
+import json
+import tempfile
+import threading
+import duckdb
+import pandas as pd
+
+sys.path.append("./ingest/")
+import config  # type: ignore
+from database import connect
+
+
+def run_query(
+    sql: str,
+    page: int = 0,
+    *,
+    database: str = config.Dashboard.Database,
+    page_size: int = config.Dashboard.Page_Size,
+    max_rows: int = config.Dashboard.Max_Rows,
+    timeout: float = config.Dashboard.Timeout,
+) -> tuple[pd.DataFrame, dict]:
+    """Runs a page of an explorer query.
+
+    The query is wrapped with LIMIT and OFFSET, so duckdb stops as soon as
+    the page is complete, and it's interrupted if it runs for longer than
+    timeout. Pages past max_rows aren't served. The connection is closed
+    once the page is read, so the database isn't locked between pages.
+
+    Args:
+        sql (str): a single SELECT query.
+        page (int): zero-based page number.
+        database (str): duckdb database path.
+        page_size (int): rows per page.
+        max_rows (int): maximum number of rows served across all pages.
+        timeout (float): seconds before the query is interrupted.
+
+    Returns:
+        The page rows, and its statistics: "elapsed" seconds, "rows-scanned"
+        and "has-next", whether there's a next page.
+
+    Raises:
+        ValueError: if sql isn't a single SELECT query, or page is past max_rows.
+        duckdb.InterruptException: if the query was interrupted by the timeout.
+    """
+    statements = duckdb.extract_statements(sql)
+    if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+        raise ValueError("Only a single SELECT query can be explored")
+
+    offset = page * page_size
+    if offset >= max_rows:
+        raise ValueError(f"Only the first {max_rows} rows can be explored")
+    limit = min(page_size, max_rows - offset)
+    query = statements[0].query.strip().rstrip(";")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        profile_path = os.path.join(tmp, "profile.json")
+        connection = connect(database, profile=profile_path)
+        timer = threading.Timer(timeout, connection.interrupt)
+        timer.start()
+        try:
+            # One extra row tells if there's a next page.
+            data = connection.sql(
+                f"SELECT * FROM (\n{query}\n) LIMIT {limit + 1} OFFSET {offset}"
+            ).df()
+        finally:
+            timer.cancel()
+            connection.close()
+
+        with open(profile_path) as file:
+            profile = json.load(file)
+
+    stats = {
+        "elapsed": profile["latency"],
+        "rows-scanned": profile["cumulative_rows_scanned"],
+        "has-next": len(data) > limit and offset + limit < max_rows,
+    }
+    return data.head(limit), stats
+
+
+def explorer(container, default: str, key: str):
+    """Renders a SQL explorer in a dashboard container.
+
+    Args:
+        container: streamlit container to render in, as a tab.
+        default (str): query shown before the user writes one.
+        key (str): unique key of the explorer widgets.
+    """
+    expander = container.expander("Filtro")
+    sql = expander.text_area("¡Escribe una Query!", default, key=key + "-sql")
+    page = expander.number_input(
+        "Página",
+        min_value=1,
+        max_value=max(1, config.Dashboard.Max_Rows // config.Dashboard.Page_Size),
+        value=1,
+        key=key + "-page",
+    )
+
+    try:
+        data, stats = run_query(sql, page - 1)
+    except duckdb.InterruptException:
+        container.error(
+            f"La query superó el tiempo límite de {config.Dashboard.Timeout} segundos."
+        )
+        return
+    except (ValueError, duckdb.Error) as e:
+        container.error(str(e))
+        return
+
+    container.dataframe(data)
+    container.caption(
+        f"{stats['elapsed']:.3f} s · {stats['rows-scanned']:,} filas escaneadas"
+        + (" · hay más páginas" if stats["has-next"] else "")
+    )
@@ -1,80 +1,95 @@
+from __future__ import annotations
+
 import sys
 import os
+import json
 import streamlit as st
-import duckdb
 import pandas as pd
 
 sys.path.append("./ingest/")
 import config  # type: ignore
+from snapshot import charts, read_snapshot
+
+
+def file_fingerprint(path: str) -> str:
+    """Fingerprint of a file, changes when it's rewritten. Empty if it doesn't exist."""
+    if not os.path.exists(path):
+        return ""
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+@st.cache_data(
+    ttl=config.Dashboard.Cache_Ttl, max_entries=config.Dashboard.Cache_Entries
+)
+def query(sql: str, fingerprint: str) -> pd.DataFrame:
+    """Runs a query on the database.
+
+    Results are cached by query and database fingerprint, so reruns
+    don't query the database again until it's rebuilt. Each query opens
+    its own short-lived connection, so the database isn't locked between
+    queries.
+
+    Args:
+        sql (str): query to run.
+        fingerprint (str): database fingerprint.
+
+    Returns:
+        The query result.
+    """
+    from database import connect
+
+    with connect() as connection:
+        return connection.sql(sql).df()
+
+
+@st.cache_data(max_entries=1)
+def load_snapshot(snapshot: str, state: str) -> dict[str, pd.DataFrame]:
+    """Reads the charts data that isn't stale from the dashboard snapshot.
+
+    Charts are checked against the tables fingerprints of the transform
+    state, if the transform phase ran here. Results are cached until the
+    snapshot or the transform state change.
+
+    Args:
+        snapshot (str): snapshot manifest fingerprint.
+        state (str): transform state fingerprint.
+    """
+    fingerprints = None
+    if os.path.exists(config.Transform.State):
+        with open(config.Transform.State) as file:
+            fingerprints = {
+                name: table["fingerprint"]
+                for name, table in json.load(file)["tables"].items()
+            }
+    return read_snapshot(config.Dashboard.Snapshot, fingerprints)
 
 
 def main():
-    ddb = duckdb.connect("./data/transformed/db.duckdb")
+    fingerprint = file_fingerprint(config.Dashboard.Database)
+
+    # Charts data comes from the snapshot, stale or missing charts are queried.
+    data = load_snapshot(
+        file_fingerprint(os.path.join(config.Dashboard.Snapshot, "manifest.json")),
+        file_fingerprint(config.Transform.State),
+    )
+    data = {
+        name: data[name] if name in data else query(chart["query"], fingerprint)
+        for name, chart in charts.items()
+    }
 
     # Valle del Cauca datasets
-    valle_exports = ddb.sql(
-        """SELECT *
-        FROM valle_exports;"""
-    ).df()
-
-    top_valle_exports = ddb.sql(
-        """SELECT POSAR, TOTAL_FOBPES
-        FROM top_valle_exports
-        LIMIT 10;"""
-    ).df()
-
-    top_valle_exports_to_korea = ddb.sql(
-        """SELECT POSAR, TOTAL_FOBPES
-        FROM top_valle_exports_to_korea
-        LIMIT 10;"""
-    ).df()
-
-    cluster_valle_world_exports = ddb.sql(
-        """SELECT POSAR, FOBPES, kmeans
-        FROM cluster_valle_world_exports"""
-    ).df()
-
-    cluster_valle_korea_exports = ddb.sql(
-        """SELECT POSAR, FOBPES, kmeans
-        FROM cluster_valle_korea_exports"""
-    ).df()
+    top_valle_exports = data["top_valle_exports"]
+    top_valle_exports_to_korea = data["top_valle_exports_to_korea"]
+    cluster_valle_world_exports = data["cluster_valle_world_exports"]
+    cluster_valle_korea_exports = data["cluster_valle_korea_exports"]
 
     # Korea datasets
-    korea_imports = ddb.sql(
-        """SELECT *
-        FROM korea_imports;"""
-    ).df()
-
-    top_korea_imports = ddb.sql(
-        """SELECT *
-        FROM top_korea_imports
-        LIMIT 10;"""
-    ).df()
-
-    top_korea_iberoamerica_imports = ddb.sql(
-        """SELECT *
-        FROM top_korea_imports_from_iberoamerica
-        LIMIT 10;"""
-    ).df()
-
-    top_korea_colombia_imports = ddb.sql(
-        """SELECT *
-        FROM top_korea_imports_from_colombia
-        LIMIT 10;"""
-    ).df()
-
-    cluster_korea_world_imports = ddb.sql(
-        """SELECT *
-        FROM cluster_korea_world_imports;"""
-    ).df()
-
-    cluster_korea_colombia_imports = ddb.sql(
-        """SELECT *
-        FROM cluster_korea_colombia_imports;"""
-    ).df()
-
-    # Close connection
-    ddb.close()
+    top_korea_imports = data["top_korea_imports"]
+    top_korea_iberoamerica_imports = data["top_korea_iberoamerica_imports"]
+    top_korea_colombia_imports = data["top_korea_colombia_imports"]
+    cluster_korea_world_imports = data["cluster_korea_world_imports"]
+    cluster_korea_colombia_imports = data["cluster_korea_colombia_imports"]
 
     # Page Content
     st.markdown("# OPORTUNIDADES DE EXPORTACIÓN PARA EL VALLE DEL CAUCA")
@@ -325,19 +340,17 @@ def main():
 
     st.markdown("## Explora los Datos")
 
-    ddb = duckdb.connect("./data/transformed/db.duckdb")
-
-    tab5, tab6 = st.tabs(["Valle del Cauca", "Corea del Sur"])
+    # Charts can be drawn from the snapshot alone, but exploring needs the database.
+    if not fingerprint:
+        st.info("La base de datos no está disponible para explorar.")
+        return
 
-    expander = tab5.expander("Filtro")
-    user = expander.text_area("¡Escribe una Query!", "SELECT * FROM valle_exports;")
-    tab5.write(ddb.sql(user))
+    from explorer import explorer
 
-    expander = tab6.expander("Filtro")
-    user = expander.text_area("¡Escribe una Query!", "SELECT * FROM korea_imports;")
-    tab6.write(ddb.sql(user))
+    tab5, tab6 = st.tabs(["Valle del Cauca", "Corea del Sur"])
 
-    ddb.close()
+    explorer(tab5, "SELECT * FROM valle_exports;", "valle")
+    explorer(tab6, "SELECT * FROM korea_imports;", "korea")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,220 @@
+"""Dashboard snapshot.
+
+This module declares the data behind each dashboard chart, and saves
+it as Arrow IPC files, so the dashboard reads them on startup instead
+of querying the database. Charts only hold the charted columns, and
+scatter charts are sampled, so each file is small and is read straight
+into the dataframe the chart is drawn from. The transform phase writes
+the snapshot after building the tables.
+
+The snapshot manifest stamps it with the snapshot format version and
+the fingerprints of the tables each chart was read from (see
+transform/pipeline.py), so stale charts can be told apart.
+
+Attributes:
+    VERSION: snapshot format version.
+    scatter_query: query selecting the points of a scatter chart.
+    charts: collection of chart declarations.
+    write_snapshot: saves the data of all charts.
+    read_snapshot: reads the data of the charts that aren't stale.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import typing
+import pyarrow as pa
+
+if typing.TYPE_CHECKING:
+    import duckdb
+    import pandas as pd
+
+sys.path.append("./ingest/")
+import config  # type: ignore
+
+VERSION = 1
+
+
+def scatter_query(table: str, x: str, y: str, color: str) -> str:
+    """Query selecting the points of a scatter chart.
+
+    Only the charted columns are selected, and tables with more rows than
+    config.Dashboard.Scatter_Points are reservoir sampled down to it inside
+    duckdb, so the chart costs the same whatever the table size.
+    The sample is repeatable, so reruns draw the same points.
+
+    Args:
+        table (str): table to chart.
+        x (str): x axis column.
+        y (str): y axis column.
+        color (str): color column.
+    """
+    return f"""SELECT {x}, {y}, {color}
+        FROM {table}
+        USING SAMPLE reservoir({config.Dashboard.Scatter_Points} ROWS) REPEATABLE (0);"""
+
+
+charts: dict[str, dict] = {
+    "top_valle_exports": {
+        "query": """SELECT POSAR, TOTAL_FOBPES
+        FROM top_valle_exports
+        LIMIT 10;""",
+        "depends-on": ["top_valle_exports"],
+    },
+    "top_valle_exports_to_korea": {
+        "query": """SELECT POSAR, TOTAL_FOBPES
+        FROM top_valle_exports_to_korea
+        LIMIT 10;""",
+        "depends-on": ["top_valle_exports_to_korea"],
+    },
+    "cluster_valle_world_exports": {
+        "query": scatter_query(
+            "cluster_valle_world_exports", "POSAR", "FOBPES", "kmeans"
+        ),
+        "depends-on": ["cluster_valle_world_exports"],
+    },
+    "cluster_valle_korea_exports": {
+        "query": scatter_query(
+            "cluster_valle_korea_exports", "POSAR", "FOBPES", "kmeans"
+        ),
+        "depends-on": ["cluster_valle_korea_exports"],
+    },
+    "top_korea_imports": {
+        "query": """SELECT cmdCode, totalValue
+        FROM top_korea_imports
+        LIMIT 10;""",
+        "depends-on": ["top_korea_imports"],
+    },
+    "top_korea_iberoamerica_imports": {
+        "query": """SELECT cmdCode, totalValue
+        FROM top_korea_imports_from_iberoamerica
+        LIMIT 10;""",
+        "depends-on": ["top_korea_imports_from_iberoamerica"],
+    },
+    "top_korea_colombia_imports": {
+        "query": """SELECT cmdCode, totalValue
+        FROM top_korea_imports_from_colombia
+        LIMIT 10;""",
+        "depends-on": ["top_korea_imports_from_colombia"],
+    },
+    "cluster_korea_world_imports": {
+        "query": scatter_query(
+            "cluster_korea_world_imports", "cmdCode", "primaryValue", "kmeans"
+        ),
+        "depends-on": ["cluster_korea_world_imports"],
+    },
+    "cluster_korea_colombia_imports": {
+        "query": scatter_query(
+            "cluster_korea_colombia_imports", "cmdCode", "primaryValue", "kmeans"
+        ),
+        "depends-on": ["cluster_korea_colombia_imports"],
+    },
+}
+
+
+def write_snapshot(
+    connection: duckdb.DuckDBPyConnection,
+    dir: str,
+    fingerprints: dict[str, str],
+) -> list[str]:
+    """Saves the data of all charts to a snapshot directory.
+
+    Each chart is saved as an uncompressed Arrow IPC file, so reading it
+    doesn't decode anything. Charts whose query fails, e.g. because its table
+    wasn't built, are left out. Files are replaced atomically, and the
+    manifest is replaced last.
+
+    Args:
+        connection (DuckDBPyConnection): database connection.
+        dir (str): snapshot directory.
+        fingerprints (dict[str, str]): fingerprint of each built table.
+
+    Returns:
+        The saved charts.
+    """
+    import duckdb
+
+    os.makedirs(dir, exist_ok=True)
+
+    saved = {}
+    for name, chart in charts.items():
+        try:
+            # Through pandas, so charts get the same types as live queries.
+            table = pa.Table.from_pandas(
+                connection.sql(chart["query"]).df(), preserve_index=False
+            )
+        except duckdb.Error as e:
+            print(f"Chart {name} was not saved to the snapshot: {e}\n")
+            continue
+
+        path = os.path.join(dir, name + ".arrow")
+        with pa.OSFile(path + ".tmp", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(path + ".tmp", path)
+
+        saved[name] = {
+            "query": chart["query"],
+            "depends-on": {dep: fingerprints.get(dep) for dep in chart["depends-on"]},
+        }
+
+    manifest = os.path.join(dir, "manifest.json")
+    with open(manifest + ".tmp", "w") as file:
+        json.dump(
+            {
+                "version": VERSION,
+                "created-at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "charts": saved,
+            },
+            file,
+            indent=2,
+            sort_keys=True,
+        )
+    os.replace(manifest + ".tmp", manifest)
+
+    print(f"Dashboard snapshot saved with {len(saved)} charts.\n")
+    return list(saved)
+
+
+def read_snapshot(
+    dir: str, fingerprints: dict[str, str] | None
+) -> dict[str, pd.DataFrame]:
+    """Reads the data of the charts that aren't stale from a snapshot directory.
+
+    A chart is stale if the snapshot has another format version, if its
+    query changed, or if the fingerprint of a table it was read from
+    changed. Without fingerprints, e.g. where the tables weren't built,
+    only the version and query are checked.
+
+    Args:
+        dir (str): snapshot directory.
+        fingerprints (dict[str, str] | None): fingerprint of each built table.
+
+    Returns:
+        The data of each chart that isn't stale.
+    """
+    manifest = os.path.join(dir, "manifest.json")
+    if not os.path.exists(manifest):
+        return {}
+    with open(manifest) as file:
+        manifest = json.load(file)
+    if manifest["version"] != VERSION:
+        return {}
+
+    data = {}
+    for name, saved in manifest["charts"].items():
+        if name not in charts or saved["query"] != charts[name]["query"]:
+            continue
+        if fingerprints is not None and any(
+            fingerprints.get(dep) != fingerprint
+            for dep, fingerprint in saved["depends-on"].items()
+        ):
+            continue
+
+        with pa.OSFile(os.path.join(dir, name + ".arrow")) as source:
+            data[name] = pa.ipc.open_file(source).read_pandas()
+
+    return data